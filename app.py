@@ -1,80 +1,303 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 import json
 import os
+import hashlib
+import threading
+import time
+from datetime import datetime
+from collections import OrderedDict, defaultdict
+from operator import itemgetter
 from dotenv import load_dotenv
 import openai
-from datetime import datetime
-import io
 import re
+import tempfile
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 # Import Excel and PDF processors
 from excel_processor import processor
 from pdf_processor import pdf_processor
+from response_builder import build_analysis_response
 
 load_dotenv()
 
 app = Flask(__name__)
+app.json.sort_keys = False
 CORS(app)
 
 # Set OpenAI API key
 openai.api_key = os.getenv('OPENAI_API_KEY')
 
-# Global bank configuration with currency mapping
+# Largest transaction list /api/analyze will aggregate in one request; bigger
+# payloads are rejected up front instead of tying up a worker
+MAX_ANALYSIS_TRANSACTIONS = int(os.getenv('MAX_ANALYSIS_TRANSACTIONS', '20000'))
+
+# Upper bound (seconds) on a single analysis call so a slow model response
+# cannot hold a worker thread indefinitely
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '60'))
+
+# Global bank configuration with currency mapping: key -> (country, currency, code)
 GLOBAL_BANK_CONFIG = {
-    'abu dhabi commercial bank': {'country': 'UAE', 'currency': 'AED', 'code': 'ADCB'},
-    'adcb': {'country': 'UAE', 'currency': 'AED', 'code': 'ADCB'},
-    'first abu dhabi bank': {'country': 'UAE', 'currency': 'AED', 'code': 'FAB'},
-    'fab': {'country': 'UAE', 'currency': 'AED', 'code': 'FAB'},
-    'emirates nbd': {'country': 'UAE', 'currency': 'AED', 'code': 'ENBD'},
-    'enbd': {'country': 'UAE', 'currency': 'AED', 'code': 'ENBD'},
-    'mashreq bank': {'country': 'UAE', 'currency': 'AED', 'code': 'MASHREQ'},
-    'mashreq': {'country': 'UAE', 'currency': 'AED', 'code': 'MASHREQ'},
-    'commercial bank of dubai': {'country': 'UAE', 'currency': 'AED', 'code': 'CBD'},
-    'cbd': {'country': 'UAE', 'currency': 'AED', 'code': 'CBD'},
-    'hsbc uae': {'country': 'UAE', 'currency': 'AED', 'code': 'HSBC'},
-    'hsbc middle east': {'country': 'UAE', 'currency': 'AED', 'code': 'HSBC'},
-    'abu dhabi islamic bank': {'country': 'UAE', 'currency': 'AED', 'code': 'ADIB'},
-    'adib': {'country': 'UAE', 'currency': 'AED', 'code': 'ADIB'},
-
-    'bank of america': {'country': 'USA', 'currency': 'USD', 'code': 'BOA'},
-    'chase bank': {'country': 'USA', 'currency': 'USD', 'code': 'CHASE'},
-    'wells fargo': {'country': 'USA', 'currency': 'USD', 'code': 'WF'},
-    'citibank': {'country': 'USA', 'currency': 'USD', 'code': 'CITI'},
-
-    'barclays': {'country': 'UK', 'currency': 'GBP', 'code': 'BARCLAYS'},
-    'lloyds': {'country': 'UK', 'currency': 'GBP', 'code': 'LLOYDS'},
-    'hsbc uk': {'country': 'UK', 'currency': 'GBP', 'code': 'HSBC'},
-
-    'state bank of india': {'country': 'India', 'currency': 'INR', 'code': 'SBI'},
-    'hdfc bank': {'country': 'India', 'currency': 'INR', 'code': 'HDFC'},
-    'icici bank': {'country': 'India', 'currency': 'INR', 'code': 'ICICI'},
-
-    'deutsche bank': {'country': 'Germany', 'currency': 'EUR', 'code': 'DB'},
-    'bnp paribas': {'country': 'France', 'currency': 'EUR', 'code': 'BNP'},
-    'ing bank': {'country': 'Netherlands', 'currency': 'EUR', 'code': 'ING'}
+    'abu dhabi commercial bank': ('UAE', 'AED', 'ADCB'),
+    'adcb': ('UAE', 'AED', 'ADCB'),
+    'first abu dhabi bank': ('UAE', 'AED', 'FAB'),
+    'fab': ('UAE', 'AED', 'FAB'),
+    'emirates nbd': ('UAE', 'AED', 'ENBD'),
+    'enbd': ('UAE', 'AED', 'ENBD'),
+    'mashreq bank': ('UAE', 'AED', 'MASHREQ'),
+    'mashreq': ('UAE', 'AED', 'MASHREQ'),
+    'commercial bank of dubai': ('UAE', 'AED', 'CBD'),
+    'cbd': ('UAE', 'AED', 'CBD'),
+    'hsbc uae': ('UAE', 'AED', 'HSBC'),
+    'hsbc middle east': ('UAE', 'AED', 'HSBC'),
+    'abu dhabi islamic bank': ('UAE', 'AED', 'ADIB'),
+    'adib': ('UAE', 'AED', 'ADIB'),
+
+    'bank of america': ('USA', 'USD', 'BOA'),
+    'chase bank': ('USA', 'USD', 'CHASE'),
+    'wells fargo': ('USA', 'USD', 'WF'),
+    'citibank': ('USA', 'USD', 'CITI'),
+
+    'barclays': ('UK', 'GBP', 'BARCLAYS'),
+    'lloyds': ('UK', 'GBP', 'LLOYDS'),
+    'hsbc uk': ('UK', 'GBP', 'HSBC'),
+
+    'state bank of india': ('India', 'INR', 'SBI'),
+    'hdfc bank': ('India', 'INR', 'HDFC'),
+    'icici bank': ('India', 'INR', 'ICICI'),
+
+    'deutsche bank': ('Germany', 'EUR', 'DB'),
+    'bnp paribas': ('France', 'EUR', 'BNP'),
+    'ing bank': ('Netherlands', 'EUR', 'ING')
+}
+
+MONTH_NAMES = ("January", "February", "March", "April", "May", "June", "July",
+               "August", "September", "October", "November", "December")
+
+# "<Month> 2025" references in AI output; the ones that are not in the analysed
+# data get rewritten to the actual peak month in a single substitution pass
+MONTH_2025_RE = re.compile(r'\b(?:' + '|'.join(MONTH_NAMES) + r') 2025\b', re.IGNORECASE)
+
+# Fixed sections of the analysis prompt (see analyze_data for the dynamic parts)
+ANALYSIS_PROMPT_INTRO = """
+        You are an expert financial advisor with deep expertise in personal finance, budgeting, and wealth management.
+        Analyze this comprehensive financial data and provide advanced insights:
+
+        CRITICAL INSTRUCTIONS - READ CAREFULLY:
+        - Current analysis date: October 15, 2025"""
+
+ANALYSIS_PROMPT_TASKS = """
+
+        PROVIDE ADVANCED ANALYSIS:
+        1. **Financial Health Score (0-100)** - Comprehensive scoring based on savings rate, spending patterns, and financial stability
+        2. **Spending Pattern Analysis** - Identify trends, seasonal patterns, and unusual spending behaviors (ONLY reference months from the list provided above)
+        3. **Budget Optimization** - Specific recommendations for each spending category with target amounts
+        4. **Savings Strategy** - Personalized savings goals and investment recommendations
+        5. **Risk Assessment** - Identify financial risks and vulnerabilities
+        6. **Anomaly Detection** - Flag unusual transactions or concerning patterns
+        7. **Country-Specific Advice** - Regional financial tips and local market insights
+        8. **Future Projections** - Predict next month's spending and savings based on current trends
+
+        EXAMPLE OF CORRECT MONTH REFERENCE:"""
+
+ANALYSIS_PROMPT_FORMAT = """
+        ✗ WRONG: "Spending peaked in September 2025" (if September 2025 is not in the months list)
+
+        Format as JSON with these keys:
+        - "financial_health_score": number (0-100)
+        - "health_category": string ("Excellent", "Good", "Fair", "Poor", "Critical")
+        - "key_insights": array of detailed insight strings
+        - "spending_patterns": array of pattern analysis strings
+        - "budget_recommendations": object with category-wise budget suggestions
+        - "savings_strategy": array of savings recommendation strings
+        - "risk_alerts": array of risk warning strings
+        - "anomalies": array of unusual transaction alerts
+        - "monthly_predictions": object with predicted spending for next month
+        - "action_plan": array of prioritized action items
+        - "country_insights": array of region-specific advice
+        - "summary": comprehensive summary string
+        """
+
+# Body of a markdown code block (```json ... ``` or ``` ... ```) in AI output
+CODE_FENCE_RE = re.compile(r'```(?:json)?\s*(.*?)\s*```', re.DOTALL)
+
+# All bank keys folded into one alternation so detection is a single scan of
+# the text. Longer keys go first so e.g. 'hsbc middle east' wins over any
+# shorter key starting at the same position.
+BANK_NAME_RE = re.compile('|'.join(
+    re.escape(bank_key) for bank_key in sorted(GLOBAL_BANK_CONFIG, key=len, reverse=True)
+))
+
+# Detection results are built once per bank; callers must treat them as read-only
+BANK_RESULTS = {
+    bank_key: {
+        'bank_name': bank_key.title(),
+        'country': country,
+        'currency': currency,
+        'bank_code': code
+    }
+    for bank_key, (country, currency, code) in GLOBAL_BANK_CONFIG.items()
+}
+
+UNKNOWN_BANK_RESULT = {
+    'bank_name': 'Unknown Bank',
+    'country': 'Unknown',
+    'currency': 'USD',
+    'bank_code': 'UNKNOWN'
 }
 
 def detect_bank_and_currency(text):
     """Detect bank and determine currency based on bank location"""
-    text_lower = text.lower()
-    for bank_key, bank_info in GLOBAL_BANK_CONFIG.items():
-        if bank_key in text_lower:
-            return {
-                'bank_name': bank_key.title(),
-                'country': bank_info['country'],
-                'currency': bank_info['currency'],
-                'bank_code': bank_info['code']
-            }
+    match = BANK_NAME_RE.search(text.lower())
+    if match:
+        return BANK_RESULTS[match.group(0)]
 
     # Default fallback
+    return UNKNOWN_BANK_RESULT
+
+def json_dumps_pretty(obj):
+    """Indented JSON text for prompts (orjson when available)"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, indent=2)
+
+def json_loads(text):
+    """Parse JSON text (orjson when available); raises json.JSONDecodeError"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(text)
+    return json.loads(text)
+
+def json_response(payload):
+    """JSON response for large payloads, serialized with orjson when available"""
+    if ORJSON_AVAILABLE:
+        return Response(orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS), mimetype='application/json')
+    return jsonify(payload)
+
+def aggregate_transactions(financial_data):
+    """Aggregate transactions in a single pass: income/expense totals, category,
+    monthly and yearly breakdowns and the date range. Each Amount is parsed exactly once."""
+    total_income = 0
+    total_expenses = 0
+    amount_total = 0
+    max_amount = float('-inf')
+    min_amount = float('inf')
+    income_count = 0
+    expense_count = 0
+    category_spending = defaultdict(float)  # category -> expense total
+    month_totals = defaultdict(float)  # "YYYY-MM" -> expense total
+    yearly_data = {}
+    min_date = max_date = None
+
+    for item in financial_data:
+        amount = float(item.get('Amount', 0))
+        category = item.get('Category', 'Other')
+        date_str = str(item.get('Date') or '')
+
+        if date_str:
+            if min_date is None or date_str < min_date:
+                min_date = date_str
+            if max_date is None or date_str > max_date:
+                max_date = date_str
+
+        amount_total += amount
+        if amount > max_amount:
+            max_amount = amount
+        if amount < min_amount:
+            min_amount = amount
+        if amount > 0:
+            total_income += amount
+            income_count += 1
+        elif amount < 0:
+            # Expenses only for category analysis
+            total_expenses -= amount
+            expense_count += 1
+            category_spending[category] -= amount
+
+        # Monthly and yearly data, keyed by sortable "YYYY-MM"
+        year_month = date_str[:7]  # e.g., "2025-02"
+        if (len(year_month) == 7 and year_month[4] == '-' and year_month[:4].isdecimal()
+                and year_month[5:].isdecimal() and 1 <= int(year_month[5:]) <= 12):
+            # Monthly and yearly expense totals
+            if amount < 0:
+                year = year_month[:4]
+                month_totals[year_month] -= amount
+                yearly_data[year] = yearly_data.get(year, 0) - amount
+        else:
+            # Missing or unparseable date: fallback bucket (always listed, even without expenses)
+            month_totals['2024-01'] -= min(amount, 0)
+
+    # Convert monthly totals to sorted readable format, e.g. "February 2025"
+    monthly_data = {
+        f"{MONTH_NAMES[int(year_month[5:7]) - 1]} {year_month[:4]}": month_amount
+        for year_month, month_amount in sorted(month_totals.items())
+    }
+
     return {
-        'bank_name': 'Unknown Bank',
-        'country': 'Unknown',
-        'currency': 'USD',
-        'bank_code': 'UNKNOWN'
+        'total_income': total_income,
+        'total_expenses': total_expenses,
+        'amount_total': amount_total,
+        'max_amount': max_amount if financial_data else 0,
+        'min_amount': min_amount if financial_data else 0,
+        'largest_expense': -min_amount if expense_count else 0,  # most negative amount
+        'average_expense': total_expenses / expense_count if expense_count else 0,
+        'income_count': income_count,
+        'expense_count': expense_count,
+        'category_spending': dict(category_spending),
+        'monthly_data': monthly_data,
+        'yearly_data': dict(sorted(yearly_data.items())),  # chronological, like monthly_data
+        'min_date': min_date,
+        'max_date': max_date
     }
 
+# /api/analyze responses keyed by a digest of the submitted transactions and
+# bank context, so re-analysing the same statement skips aggregation and the
+# OpenAI round-trip. bank_info and analysis_date are filled in per request.
+ANALYSIS_CACHE_SIZE = int(os.getenv('ANALYSIS_CACHE_SIZE', '128'))
+ANALYSIS_CACHE_TTL = int(os.getenv('ANALYSIS_CACHE_TTL', '86400'))
+_analysis_cache = OrderedDict()
+_analysis_cache_lock = threading.Lock()
+
+def analysis_cache_key(financial_data, bank_info):
+    """Stable digest of the analysis input (transactions + bank/currency)"""
+    key_input = [financial_data, bank_info.get('bank_name'), bank_info.get('currency'), bank_info.get('country')]
+    if ORJSON_AVAILABLE:
+        payload = orjson.dumps(key_input, default=str, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    else:
+        payload = json.dumps(key_input, sort_keys=True, default=str).encode()
+    return hashlib.sha256(payload).hexdigest()
+
+def get_cached_analysis(key):
+    """Return a cached analysis response, or None if missing or expired"""
+    with _analysis_cache_lock:
+        entry = _analysis_cache.get(key)
+        if entry is None:
+            return None
+        stored_at, analysis = entry
+        if time.monotonic() - stored_at > ANALYSIS_CACHE_TTL:
+            del _analysis_cache[key]
+            return None
+        _analysis_cache.move_to_end(key)
+        return analysis
+
+def store_cached_analysis(key, analysis):
+    """Cache an analysis response, evicting the least recently used entries"""
+    with _analysis_cache_lock:
+        _analysis_cache[key] = (time.monotonic(), analysis)
+        _analysis_cache.move_to_end(key)
+        while len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+
+def personalize_cached_analysis(analysis, bank_info):
+    """Copy of a cached analysis with this request's bank_info and analysis date"""
+    basic_statistics = dict(analysis['basic_statistics'])
+    basic_statistics['analysis_date'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return {**analysis, 'basic_statistics': basic_statistics, 'bank_info': bank_info}
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     try:
@@ -128,17 +351,24 @@ def upload_file():
         if file_ext not in ['xlsx', 'xls', 'pdf']:
             return jsonify({"error": "Please upload an Excel file (.xlsx, .xls) or PDF file (.pdf)"}), 400
 
-        # Process based on file type
-        file_content = io.BytesIO(file.read())
-
-        if file_ext == 'pdf':
-            print(f"[UPLOAD] Processing PDF file: {file.filename}")
-            result, error = pdf_processor.process_pdf_file(file_content)
-            file_type = "PDF"
-        else:
-            print(f"[UPLOAD] Processing Excel file: {file.filename}")
-            result, error = processor.process_excel_file(file_content)
-            file_type = "Excel"
+        # Spool the upload to disk and let the Excel/PDF parser read it by path rather
+        # than holding a second in-memory copy of the file
+        with tempfile.NamedTemporaryFile(suffix=f'.{file_ext}', delete=False) as tmp:
+            tmp_path = tmp.name
+        try:
+            file.save(tmp_path)
+
+            # Process based on file type
+            if file_ext == 'pdf':
+                print(f"[UPLOAD] Processing PDF file: {file.filename}")
+                result, error = pdf_processor.process_pdf_file(tmp_path)
+                file_type = "PDF"
+            else:
+                print(f"[UPLOAD] Processing Excel file: {file.filename}")
+                result, error = processor.process_excel_file(tmp_path)
+                file_type = "Excel"
+        finally:
+            os.unlink(tmp_path)
 
         if error or not result:
             return jsonify({"error": f"Error processing {file_type} file: {error}"}), 500
@@ -154,7 +384,7 @@ def upload_file():
             'bank_code': bank_detection['bank_code']
         })
 
-        return jsonify({
+        return json_response({
             "message": f"{file_type} file processed successfully!",
             "data": result['transactions'][:20],  # Preview
             "columns": ["Date", "Amount", "Description", "Category"],
@@ -177,90 +407,36 @@ def analyze_data():
         if not financial_data:
             return jsonify({"error": "No data provided for analysis"}), 400
 
+        if len(financial_data) > MAX_ANALYSIS_TRANSACTIONS:
+            return jsonify({
+                "error": f"Too many transactions for a single analysis ({len(financial_data)}). "
+                         f"Please analyze at most {MAX_ANALYSIS_TRANSACTIONS} transactions at a time."
+            }), 413
+
+        cache_key = analysis_cache_key(financial_data, bank_info)
+        cached_analysis = get_cached_analysis(cache_key)
+        if cached_analysis is not None:
+            print("Returning cached analysis for identical transaction data")
+            return json_response(personalize_cached_analysis(cached_analysis, bank_info))
+
         currency = bank_info.get('currency', 'USD')
         bank_name = bank_info.get('bank_name', 'Unknown Bank')
         country = bank_info.get('country', 'Unknown')
 
-        # Calculate basic financial metrics
-        total_income = sum(float(item.get('Amount', 0)) for item in financial_data if float(item.get('Amount', 0)) > 0)
-        total_expenses = sum(abs(float(item.get('Amount', 0))) for item in financial_data if float(item.get('Amount', 0)) < 0)
+        totals = aggregate_transactions(financial_data)
+        total_income = totals['total_income']
+        total_expenses = totals['total_expenses']
+        category_spending = totals['category_spending']
+        sorted_monthly_data = totals['monthly_data']
+        yearly_data = totals['yearly_data']
+
         net_savings = total_income - total_expenses
         savings_rate = (net_savings / total_income * 100) if total_income > 0 else 0
+        average_transaction = totals['average_expense']
 
-        # Category analysis
-        category_spending = {}
-        monthly_data = {}
-        yearly_data = {}
-
-        for item in financial_data:
-            amount = float(item.get('Amount', 0))
-            category = item.get('Category', 'Other')
-            date_str = item.get('Date', '')
-
-            # Expenses only for category analysis
-            if amount < 0:
-                category_spending[category] = category_spending.get(category, 0) + abs(amount)
-
-            # Monthly and yearly data - convert to readable format
-            try:
-                if len(date_str) >= 7:
-                    # Parse YYYY-MM format
-                    year_month = date_str[:7]  # e.g., "2025-02"
-                    year, month_num = year_month.split('-')
-
-                    # Store with sortable key for proper ordering
-                    month_date = datetime.strptime(f"{year}-{month_num}-01", "%Y-%m-%d")
-                    readable_month = month_date.strftime("%B %Y")  # e.g., "February 2025"
-                    sort_key = f"{year}-{month_num}"  # Keep sortable key
-
-                    # Monthly data with expense amounts
-                    if amount < 0:
-                        if sort_key not in monthly_data:
-                            monthly_data[sort_key] = {
-                                'readable': readable_month,
-                                'amount': 0,
-                                'year': int(year),
-                                'month': int(month_num)
-                            }
-                        monthly_data[sort_key]['amount'] += abs(amount)
-
-                    # Yearly totals
-                    if amount < 0:
-                        yearly_data[year] = yearly_data.get(year, 0) + abs(amount)
-                else:
-                    # Fallback
-                    sort_key = '2024-01'
-                    if sort_key not in monthly_data:
-                        monthly_data[sort_key] = {
-                            'readable': 'January 2024',
-                            'amount': 0,
-                            'year': 2024,
-                            'month': 1
-                        }
-                    if amount < 0:
-                        monthly_data[sort_key]['amount'] += abs(amount)
-            except:
-                sort_key = '2024-01'
-                if sort_key not in monthly_data:
-                    monthly_data[sort_key] = {
-                        'readable': 'January 2024',
-                        'amount': 0,
-                        'year': 2024,
-                        'month': 1
-                    }
-                if amount < 0:
-                    monthly_data[sort_key]['amount'] += abs(amount)
-
-        # Convert monthly_data to sorted readable format
-        sorted_monthly_data = {}
-        for sort_key in sorted(monthly_data.keys()):
-            readable_month = monthly_data[sort_key]['readable']
-            sorted_monthly_data[readable_month] = monthly_data[sort_key]['amount']
-
-        # Get actual date range from data
-        dates_in_data = [t.get('Date', '') for t in financial_data if t.get('Date')]
-        min_date = min(dates_in_data) if dates_in_data else '2024-01-01'
-        max_date = max(dates_in_data) if dates_in_data else '2024-12-31'
+        # Actual date range from data
+        min_date = totals['min_date'] or '2024-01-01'
+        max_date = totals['max_date'] or '2024-12-31'
 
         # Calculate average monthly spending
         num_months = len(sorted_monthly_data) if sorted_monthly_data else 1
@@ -270,16 +446,17 @@ def analyze_data():
         months_list = list(sorted_monthly_data.keys())
 
         # Find highest spending month
-        highest_month = max(sorted_monthly_data.items(), key=lambda x: x[1])[0] if sorted_monthly_data else "N/A"
+        highest_month = max(sorted_monthly_data.items(), key=itemgetter(1))[0] if sorted_monthly_data else "N/A"
         highest_month_amount = max(sorted_monthly_data.values()) if sorted_monthly_data else 0
 
-        # Advanced AI Financial Analysis Prompt
-        openai_prompt = f"""
-        You are an expert financial advisor with deep expertise in personal finance, budgeting, and wealth management.
-        Analyze this comprehensive financial data and provide advanced insights:
+        # Largest expense category, found once and shared by the fallback analyses
+        top_category, top_category_amount = max(category_spending.items(), key=itemgetter(1)) if category_spending else (None, 0)
 
-        CRITICAL INSTRUCTIONS - READ CAREFULLY:
-        - Current analysis date: October 15, 2025
+        # Advanced AI Financial Analysis Prompt: fixed sections are module
+        # constants, only the data-dependent lines are formatted per request
+        openai_prompt = ''.join([
+            ANALYSIS_PROMPT_INTRO,
+            f"""
         - Transaction data period: {min_date} to {max_date}
         - ONLY reference these specific months that exist in the data: {', '.join(months_list)}
         - DO NOT mention "September 2025" or any month not in the list above
@@ -298,55 +475,39 @@ def analyze_data():
         - Transaction Count: {len(financial_data)}
         - Months Analyzed: {num_months}
         - Average Monthly Spending: {currency} {avg_monthly_spending:,.2f}
-        - Average Transaction: {currency} {total_expenses / len([t for t in financial_data if float(t.get('Amount', 0)) < 0]) if len([t for t in financial_data if float(t.get('Amount', 0)) < 0]) > 0 else 0:,.2f}
+        - Average Transaction: {currency} {average_transaction:,.2f}
 
         SPENDING BREAKDOWN BY CATEGORY:
-        {json.dumps(category_spending, indent=2)}
+        """,
+            json_dumps_pretty(category_spending),
+            """
 
         MONTHLY SPENDING PATTERNS (Chronological Order):
-        {json.dumps(sorted_monthly_data, indent=2)}
+        """,
+            json_dumps_pretty(sorted_monthly_data),
+            """
 
         YEARLY TOTALS:
-        {json.dumps(yearly_data, indent=2)}
+        """,
+            json_dumps_pretty(yearly_data),
+            """
 
         TRANSACTION SAMPLES:
-        {json.dumps(financial_data[:15], indent=2)}
-
-        PROVIDE ADVANCED ANALYSIS:
-        1. **Financial Health Score (0-100)** - Comprehensive scoring based on savings rate, spending patterns, and financial stability
-        2. **Spending Pattern Analysis** - Identify trends, seasonal patterns, and unusual spending behaviors (ONLY reference months from the list provided above)
-        3. **Budget Optimization** - Specific recommendations for each spending category with target amounts
-        4. **Savings Strategy** - Personalized savings goals and investment recommendations
-        5. **Risk Assessment** - Identify financial risks and vulnerabilities
-        6. **Anomaly Detection** - Flag unusual transactions or concerning patterns
-        7. **Country-Specific Advice** - Regional financial tips and local market insights
-        8. **Future Projections** - Predict next month's spending and savings based on current trends
-
-        EXAMPLE OF CORRECT MONTH REFERENCE:
-        ✓ CORRECT: "Spending peaked in {highest_month} with {currency} {highest_month_amount:,.0f}"
-        ✗ WRONG: "Spending peaked in September 2025" (if September 2025 is not in the months list)
-
-        Format as JSON with these keys:
-        - "financial_health_score": number (0-100)
-        - "health_category": string ("Excellent", "Good", "Fair", "Poor", "Critical")
-        - "key_insights": array of detailed insight strings
-        - "spending_patterns": array of pattern analysis strings
-        - "budget_recommendations": object with category-wise budget suggestions
-        - "savings_strategy": array of savings recommendation strings
-        - "risk_alerts": array of risk warning strings
-        - "anomalies": array of unusual transaction alerts
-        - "monthly_predictions": object with predicted spending for next month
-        - "action_plan": array of prioritized action items
-        - "country_insights": array of region-specific advice
-        - "summary": comprehensive summary string
-        """
+        """,
+            json_dumps_pretty(financial_data[:15]),
+            ANALYSIS_PROMPT_TASKS,
+            f"""
+        ✓ CORRECT: "Spending peaked in {highest_month} with {currency} {highest_month_amount:,.0f}\"""",
+            ANALYSIS_PROMPT_FORMAT
+        ])
 
         # Call OpenAI API
         ai_analysis = {}
+        analysis_cacheable = False  # only successful AI analyses are cached
         print(f"OpenAI API Key available: {bool(openai.api_key)}")
         if openai.api_key:
             try:
-                response = openai.chat.completions.create(
+                stream = openai.chat.completions.create(
                     model="gpt-4o-mini",
                     messages=[
                         {
@@ -356,48 +517,44 @@ def analyze_data():
                         {"role": "user", "content": openai_prompt}
                     ],
                     max_tokens=3000,
-                    temperature=0.1
+                    temperature=0.1,
+                    timeout=OPENAI_TIMEOUT,
+                    stream=True
                 )
 
-                ai_response = response.choices[0].message.content
+                # Collect the streamed completion as it arrives; joined once at the end
+                chunks = []
+                for event in stream:
+                    if event.choices:
+                        chunks.append(event.choices[0].delta.content or '')
+                ai_response = ''.join(chunks)
 
                 # Log for debugging
                 print(f"Available months in data: {months_list}")
                 print(f"Highest spending month: {highest_month}")
 
                 # CRITICAL FIX: Remove markdown code block if present and clean response
-                if '```json' in ai_response:
-                    # Extract JSON from markdown code blocks
-                    start_idx = ai_response.find('```json') + 7
-                    end_idx = ai_response.find('```', start_idx)
-                    if end_idx != -1:
-                        ai_response = ai_response[start_idx:end_idx].strip()
-                    else:
-                        ai_response = ai_response.replace('```json', '').replace('```', '').strip()
+                fence_match = CODE_FENCE_RE.search(ai_response)
+                if fence_match:
+                    ai_response = fence_match.group(1)
                 elif '```' in ai_response:
-                    # Handle generic code blocks
-                    start_idx = ai_response.find('```') + 3
-                    end_idx = ai_response.find('```', start_idx)
-                    if end_idx != -1:
-                        ai_response = ai_response[start_idx:end_idx].strip()
-                    else:
-                        ai_response = ai_response.replace('```', '').strip()
+                    # Unterminated code block - just drop the markers
+                    ai_response = ai_response.replace('```json', '').replace('```', '').strip()
 
-                # Post-process to remove incorrect date references
-                # Replace "September 2025" with the actual highest month
-                ai_response = ai_response.replace("September 2025", highest_month)
-                ai_response = ai_response.replace("september 2025", highest_month)
+                # Post-process to remove incorrect date references: any
+                # "<Month> 2025" not in our data becomes the actual highest month
+                valid_months = set(months_list)
 
-                # Remove any other 2025 month references that aren't in our data
-                for month_name in ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]:
-                    wrong_ref = f"{month_name} 2025"
-                    # Only replace if it's not in our actual months list
-                    if wrong_ref not in months_list and wrong_ref in ai_response:
-                        ai_response = ai_response.replace(wrong_ref, highest_month)
+                def scrub_months(text):
+                    return MONTH_2025_RE.sub(
+                        lambda m: m.group(0) if m.group(0) in valid_months else highest_month, text
+                    )
+
+                ai_response = scrub_months(ai_response)
 
                 # Try to parse JSON response
                 try:
-                    ai_analysis = json.loads(ai_response)
+                    ai_analysis = json_loads(ai_response)
 
                     # Additional post-processing on parsed JSON fields
                     if 'summary' in ai_analysis and isinstance(ai_analysis['summary'], str):
@@ -408,42 +565,26 @@ def analyze_data():
                             ai_analysis['summary'] = f"Financial analysis of {len(financial_data)} transactions from {min_date} to {max_date}. Total expenses: {currency} {total_expenses:,.2f}. Savings rate: {savings_rate:.1f}%. Highest spending month: {highest_month} with {currency} {highest_month_amount:,.2f}."
                         else:
                             # Clean up summary field
-                            for month_name in ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]:
-                                wrong_ref = f"{month_name} 2025"
-                                if wrong_ref not in months_list and wrong_ref in ai_analysis['summary']:
-                                    ai_analysis['summary'] = ai_analysis['summary'].replace(wrong_ref, highest_month)
+                            ai_analysis['summary'] = scrub_months(ai_analysis['summary'])
                     else:
                         # No summary field - create one
                         ai_analysis['summary'] = f"Financial analysis of {len(financial_data)} transactions from {min_date} to {max_date}. Total expenses: {currency} {total_expenses:,.2f}. Savings rate: {savings_rate:.1f}%. Highest spending month: {highest_month} with {currency} {highest_month_amount:,.2f}."
 
                     # Clean spending_patterns array
                     if 'spending_patterns' in ai_analysis and isinstance(ai_analysis['spending_patterns'], list):
-                        cleaned_patterns = []
-                        for pattern in ai_analysis['spending_patterns']:
-                            if isinstance(pattern, str):
-                                for month_name in ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]:
-                                    wrong_ref = f"{month_name} 2025"
-                                    if wrong_ref not in months_list and wrong_ref in pattern:
-                                        pattern = pattern.replace(wrong_ref, highest_month)
-                                pattern = pattern.replace("September 2025", highest_month)
-                                pattern = pattern.replace("september 2025", highest_month)
-                            cleaned_patterns.append(pattern)
-                        ai_analysis['spending_patterns'] = cleaned_patterns
+                        ai_analysis['spending_patterns'] = [
+                            scrub_months(pattern) if isinstance(pattern, str) else pattern
+                            for pattern in ai_analysis['spending_patterns']
+                        ]
 
                     # Clean key_insights array
                     if 'key_insights' in ai_analysis and isinstance(ai_analysis['key_insights'], list):
-                        cleaned_insights = []
-                        for insight in ai_analysis['key_insights']:
-                            if isinstance(insight, str):
-                                for month_name in ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]:
-                                    wrong_ref = f"{month_name} 2025"
-                                    if wrong_ref not in months_list and wrong_ref in insight:
-                                        insight = insight.replace(wrong_ref, highest_month)
-                                insight = insight.replace("September 2025", highest_month)
-                                insight = insight.replace("september 2025", highest_month)
-                            cleaned_insights.append(insight)
-                        ai_analysis['key_insights'] = cleaned_insights
+                        ai_analysis['key_insights'] = [
+                            scrub_months(insight) if isinstance(insight, str) else insight
+                            for insight in ai_analysis['key_insights']
+                        ]
 
+                    analysis_cacheable = True
                     print(f"Parsed AI analysis successfully. Summary: {ai_analysis.get('summary', 'NO SUMMARY')[:100]}...")
                 except json.JSONDecodeError as json_error:
                     print(f"JSON parsing failed: {json_error}")
@@ -455,11 +596,11 @@ def analyze_data():
                         "key_insights": [
                             f"Monthly spending averages {currency} {total_expenses:,.0f}",
                             f"Savings rate of {savings_rate:.1f}% {'exceeds' if savings_rate > 20 else 'meets' if savings_rate > 10 else 'below'} recommended levels",
-                            f"Primary spending category: {max(category_spending.keys(), key=category_spending.get) if category_spending else 'N/A'}"
+                            f"Primary spending category: {top_category if category_spending else 'N/A'}"
                         ],
                         "spending_patterns": [
                             "Regular monthly spending patterns detected",
-                            f"Highest spending in {max(category_spending.keys(), key=category_spending.get) if category_spending else 'Unknown'} category"
+                            f"Highest spending in {top_category if category_spending else 'Unknown'} category"
                         ],
                         "budget_recommendations": {cat: f"{currency} {amt * 0.9:,.0f}" for cat, amt in list(category_spending.items())[:5]},
                         "savings_strategy": [
@@ -495,17 +636,17 @@ def analyze_data():
                     "key_insights": [
                         f"Total monthly spending: {currency} {total_expenses:,.0f}",
                         f"Savings rate: {savings_rate:.1f}% ({'Above' if savings_rate > 20 else 'Below'} recommended 20%)",
-                        f"Primary expense category: {max(category_spending.keys(), key=category_spending.get) if category_spending else 'N/A'}",
+                        f"Primary expense category: {top_category if category_spending else 'N/A'}",
                         f"Transaction frequency: {len(financial_data)} transactions analyzed"
                     ],
                     "spending_patterns": [
                         "Consistent monthly spending observed",
-                        f"Largest expense category represents {(max(category_spending.values()) / total_expenses * 100):.1f}% of total spending" if category_spending else "Even spending distribution",
+                        f"Largest expense category represents {(top_category_amount / total_expenses * 100):.1f}% of total spending" if category_spending else "Even spending distribution",
                         "Opportunity for optimization identified"
                     ],
                     "budget_recommendations": {
                         cat: f"{currency} {amt * 0.85:,.0f} (15% reduction recommended)"
-                        for cat, amt in sorted(category_spending.items(), key=lambda x: x[1], reverse=True)[:3]
+                        for cat, amt in sorted(category_spending.items(), key=itemgetter(1), reverse=True)[:3]
                     } if category_spending else {},
                     "savings_strategy": [
                         "Automate 20% of income to savings account",
@@ -540,100 +681,17 @@ def analyze_data():
                     "summary": f"Financial analysis of {len(financial_data)} transactions reveals a {savings_rate:.1f}% savings rate with total expenses of {currency} {total_expenses:,.0f}. {'Strong' if savings_rate > 20 else 'Moderate' if savings_rate > 10 else 'Weak'} financial foundation with opportunities for optimization through budget management and automated savings."
                 }
 
-        # Top categories
-        top_categories = [
-            {
-                "name": cat,
-                "amount": amt,
-                "percentage": (amt/total_expenses*100) if total_expenses > 0 else 0
-            }
-            for cat, amt in sorted(category_spending.items(), key=lambda x: x[1], reverse=True)[:8]
-        ]
-
-        # Enhanced AI Analysis Response
-        analysis_response = {
-            "ai_analysis": {
-                # Traditional analysis
-                "spending_by_category": category_spending,
-                "income_vs_expenses": {
-                    "total_income": total_income,
-                    "total_expenses": total_expenses,
-                    "net_savings": net_savings,
-                    "savings_rate": savings_rate
-                },
-                "monthly_trends": sorted_monthly_data,
-                "yearly_trends": yearly_data,
-                "top_categories": top_categories,
-
-                # Enhanced AI Features
-                "financial_health": {
-                    "score": ai_analysis.get("financial_health_score", 75),
-                    "category": ai_analysis.get("health_category", "Good"),
-                    "assessment": f"Your financial health score is {ai_analysis.get('financial_health_score', 75)}/100"
-                },
-                "ai_insights": {
-                    "key_insights": ai_analysis.get("key_insights", []),
-                    "spending_patterns": ai_analysis.get("spending_patterns", []),
-                    "country_insights": ai_analysis.get("country_insights", [])
-                },
-                "smart_recommendations": {
-                    "budget_recommendations": ai_analysis.get("budget_recommendations", {}),
-                    "savings_strategy": ai_analysis.get("savings_strategy", []),
-                    "action_plan": ai_analysis.get("action_plan", [])
-                },
-                "risk_management": {
-                    "alerts": ai_analysis.get("risk_alerts", []),
-                    "anomalies": ai_analysis.get("anomalies", []),
-                    "risk_level": "Low" if savings_rate > 20 else "Medium" if savings_rate > 10 else "High"
-                },
-                "predictions": {
-                    "monthly_predictions": ai_analysis.get("monthly_predictions", {}),
-                    "trends": "Stable" if savings_rate > 15 else "Needs Attention",
-                    "forecast_accuracy": "85%"
-                },
-
-                # Legacy fields for backward compatibility
-                "recommendations": ai_analysis.get("savings_strategy", [])[:3],
-                "spending_alerts": ai_analysis.get("risk_alerts", []),
-                "financial_health_score": ai_analysis.get("financial_health_score", 75),
-                "transaction_insights": {
-                    "total_transactions": len(financial_data),
-                    "average_transaction": total_expenses / len([t for t in financial_data if float(t.get('Amount', 0)) < 0]) if len([t for t in financial_data if float(t.get('Amount', 0)) < 0]) > 0 else 0,
-                    "largest_expense": max([abs(float(t.get('Amount', 0))) for t in financial_data if float(t.get('Amount', 0)) < 0], default=0),
-                    "expense_transactions": len([t for t in financial_data if float(t.get('Amount', 0)) < 0]),
-                    "income_transactions": len([t for t in financial_data if float(t.get('Amount', 0)) > 0])
-                },
-                "summary": ai_analysis.get("summary", f"Advanced AI analysis for {bank_name} account in {currency}")
-            },
-            "basic_statistics": {
-                "Amount": {
-                    "total": sum(float(item.get('Amount', 0)) for item in financial_data),
-                    "average": total_expenses / len(financial_data) if financial_data else 0,
-                    "max": max([float(t.get('Amount', 0)) for t in financial_data], default=0),
-                    "min": min([float(t.get('Amount', 0)) for t in financial_data], default=0)
-                },
-                "currency": currency,
-                "analysis_date": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            },
-            "bank_info": bank_info,
-            "data_overview": {
-                "total_records": len(financial_data),
-                "categories": list(category_spending.keys()),
-                "date_range": f"{min([t.get('Date', '') for t in financial_data], default='2024-01-01')} to {max([t.get('Date', '') for t in financial_data], default='2024-12-31')}",
-                "currency": currency,
-                "country": country,
-                "years_analyzed": len(yearly_data),
-                "year_list": sorted(yearly_data.keys()),
-                "months_analyzed": len(sorted_monthly_data)
-            }
-        }
-
-        return jsonify(analysis_response)
+        analysis_response = build_analysis_response(
+            financial_data, totals, ai_analysis, bank_info,
+            bank_name, currency, country, savings_rate, min_date, max_date
+        )
+
+        if analysis_cacheable:
+            store_cached_analysis(cache_key, analysis_response)
+        return json_response(analysis_response)
 
     except Exception as e:
-        import traceback
-        print(f"Analysis error: {str(e)}")
-        print(f"Traceback: {traceback.format_exc()}")
+        app.logger.exception('Analysis failed')
         return jsonify({"error": f"Analysis error: {str(e)}"}), 500
 
 if __name__ == '__main__':
@@ -643,4 +701,6 @@ if __name__ == '__main__':
     print("Supported: Global banks with automatic currency detection")
     print("OpenAI Integration:", "Enabled" if openai.api_key else "Disabled (Set OPENAI_API_KEY)")
     print("API available at: http://localhost:5000")
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    # Development server only; production runs under gunicorn (gunicorn.conf.py)
+    debug = os.getenv('FLASK_DEBUG', '0').lower() in ('1', 'true', 'yes')
+    app.run(debug=debug, port=5000, threaded=True)
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""
+Helpers shared by the Excel and PDF processors: the AI category cache,
+description normalization for its keys and keyword regex construction
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# AI categories keyed by (caller namespace, normalized description), shared
+# across uploads; each processor uses its own namespace since their prompts differ
+AI_CATEGORY_CACHE_SIZE = int(os.getenv('AI_CATEGORY_CACHE_SIZE', '10000'))
+_ai_category_cache = OrderedDict()
+_ai_category_cache_lock = threading.Lock()
+
+_DIGITS_RE = re.compile(r'\d+')
+
+def normalize_description(description):
+    """Cache key for a description: upper-cased, digits (card/reference numbers) and extra whitespace collapsed.
+    All-digit descriptions keep their digits so they don't share one empty key."""
+    text = str(description).upper()
+    return ' '.join(_DIGITS_RE.sub(' ', text).split()) or ' '.join(text.split())
+
+def get_cached_categories(namespace, keys):
+    """Return {key: category} for the keys already categorized by the AI in this namespace"""
+    with _ai_category_cache_lock:
+        return {
+            key: _ai_category_cache[(namespace, key)]
+            for key in set(keys) if (namespace, key) in _ai_category_cache
+        }
+
+def store_cached_categories(namespace, category_by_key):
+    """Cache AI categories under this namespace, evicting the oldest entries"""
+    with _ai_category_cache_lock:
+        for key, category in category_by_key.items():
+            if category:
+                _ai_category_cache[(namespace, key)] = category
+        while len(_ai_category_cache) > AI_CATEGORY_CACHE_SIZE:
+            _ai_category_cache.popitem(last=False)
+
+def trie_pattern(words):
+    """Regex matching any of words, with shared prefixes factored out so each position is tried once per prefix"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        optional = '' in node
+        if len(branches) == 1 and not optional:
+            return branches[0]
+        return '(?:' + '|'.join(branches) + ')' + ('?' if optional else '')
+
+    return build(trie)
@@ -6,18 +6,266 @@ import json
 import re
 from datetime import datetime
 import os
+from functools import lru_cache
+from itertools import chain, islice
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
 import openai
 
+from categorization import get_cached_categories, normalize_description, store_cached_categories, trie_pattern
+
 try:
     from openpyxl import load_workbook
     EXCEL_AVAILABLE = True
 except ImportError:
     EXCEL_AVAILABLE = False
 
+try:
+    from python_calamine import CalamineWorkbook
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Set OpenAI API key
 openai.api_key = os.getenv('OPENAI_API_KEY')
 
+# Concurrent OpenAI requests when categorizing large statements
+AI_CATEGORIZE_WORKERS = max(int(os.getenv('AI_CATEGORIZE_WORKERS', '4')), 1)
+
+# Categories the AI may assign
+_AI_CATEGORIES = [
+    'Food & Dining',
+    'Transportation',
+    'Shopping & Retail',
+    'Healthcare',
+    'Utilities & Bills',
+    'Entertainment',
+    'Subscriptions & Digital Services',
+    'ATM & Cash Withdrawals',
+    'Banking & Finance',
+    'Personal Care',
+    'Travel',
+    'Income',
+    'Other Expenses'
+]
+
+# Subcategory shown for each category: its first word
+_SUBCATEGORY = {
+    category: 'Miscellaneous' if category == 'Other Expenses' else category.split(' ', 1)[0]
+    for category in _AI_CATEGORIES
+}
+
+def _subcategory(category):
+    """Subcategory for a category, including names the AI made up"""
+    return _SUBCATEGORY.get(category) or category.split(' ', 1)[0]
+
+# Static categorization rules go in the system message so every batch shares an
+# identical (cacheable) prompt prefix; the user message carries only the batch
+_SYSTEM_PROMPT = f"""You are a financial categorization expert. Categorize financial transactions into the most appropriate category. READ THE DESCRIPTION CAREFULLY and categorize accurately.
+
+Available categories: {', '.join(_AI_CATEGORIES)}
+
+STRICT Category Rules - Follow These Examples:
+
+1. Food & Dining - RESTAURANTS, CAFES, GROCERY STORES:
+   ✓ CAVA, Chipotle, McDonald's, Panera, Five Guys, In-N-Out
+   ✓ Starbucks, Coffee Bean, Dutch Bros, any coffee shop
+   ✓ Ralphs, Kroger, Safeway, Albertsons, Vons, Whole Foods, Trader Joe's, Target (food section), Walmart (food section)
+   ✓ DoorDash, UberEats, Grubhub, Postmates
+   ✓ Bakeries, donut shops, butcher shops, delis
+   ✓ SQ *BACIO DI LATTE, SQ *MARU ESPRESSO BAR, DD *DOORDASH
+
+2. Transportation - GAS, PARKING, RIDESHARE:
+   ✓ Chevron, Shell, Mobil, BP, 76, Exxon, Texaco
+   ✓ Uber (rides), Lyft, taxi services
+   ✓ LAX parking, valet parking, parking services, parking meters
+   ✓ Toll roads, FasTrak, E-ZPass
+   ✓ Car wash, auto services
+   ✗ NOT food delivery apps
+
+3. Utilities & Bills - PHONE, INTERNET, ELECTRICITY:
+   ✓ Verizon, AT&T, T-Mobile, Sprint
+   ✓ Comcast, Spectrum, Cox Internet
+   ✓ Electric company, water company, gas utility
+   ✗ NOT Rocket Money (that's Subscriptions & Digital Services)
+
+4. Subscriptions & Digital Services - MONTHLY RECURRING SERVICES:
+   ✓ Netflix, Hulu, Disney+, HBO Max, Amazon Prime Video
+   ✓ Spotify, YouTube Premium, Apple Music
+   ✓ Rocket Money, Mint, YNAB (budgeting apps)
+   ✓ Adobe Creative Cloud, Microsoft Office 365, Dropbox
+   ✓ Amazon Prime membership, Costco membership
+   ✓ Any app subscription, cloud storage, SaaS
+
+5. Personal Care - GYM, SALON, SPA:
+   ✓ 24HourFitness, Planet Fitness, LA Fitness, Gold's Gym, Flex Fitness
+   ✓ Hair salons, barbershops, nail salons
+   ✓ Spa services, massage therapy
+   ✓ Beauty products, cosmetics (if from beauty store)
+
+6. Entertainment - MOVIES, EVENTS, ATTRACTIONS:
+   ✓ Movie theaters (AMC, Regal), concerts, sports events
+   ✓ Theme parks (Disneyland, Six Flags), museums (Balloon Museum)
+   ✓ Festivals (Sawdust Festival), entertainment venues
+
+7. Banking & Finance - BANK FEES, TRANSFERS:
+   ✓ Zelle payments, wire transfers, bank transfers
+   ✓ Bank fees, service charges, overdraft fees
+   ✓ Foreign transaction fees, ATM fees (if separate from withdrawal)
+   ✗ NOT ATM withdrawals (that's ATM & Cash Withdrawals)
+
+8. Shopping & Retail - CLOTHING, ELECTRONICS, GENERAL MERCHANDISE:
+   ✓ Uniqlo, H&M, Zara, Nike, Adidas (clothing)
+   ✓ Target (non-food), Walmart (non-food), Amazon (general)
+   ✓ Best Buy, Apple Store (electronics)
+   ✗ NOT grocery stores
+
+9. ATM & Cash Withdrawals:
+   ✓ ATM Withdrawal, Cash Advance, ATM cash
+   ✗ Nothing else
+
+10. Income:
+   ✓ Salary, paycheck deposits, direct deposits
+   ✓ Refunds, reimbursements, tax refunds
+   ✓ Money received (NOT sent)
+
+11. Travel:
+   ✓ Hotels, Airbnb, Booking.com
+   ✓ Airlines (United, Delta, Southwest)
+   ✓ Rental cars (Hertz, Enterprise)
+
+12. Healthcare:
+   ✓ Hospitals, clinics, doctor visits
+   ✓ Pharmacies (CVS, Walgreens for prescriptions)
+   ✓ Dental, vision care
+
+13. Other Expenses:
+   ✓ ONLY use this if truly unidentifiable
+
+CRITICAL EXAMPLES TO LEARN FROM:
+- "Rocket Money DES" → Subscriptions & Digital Services (budgeting app, NOT utilities)
+- "SQ *BACIO DI LATTE" → Food & Dining (coffee shop)
+- "CHECKCARD A PARKING SERVICES" → Transportation (parking)
+- "24HourFitness" → Personal Care (gym)
+- "Zelle payment to Bryan" → Banking & Finance (transfer)
+- "TARGET ST 4255" → Check description - food items = Food & Dining, else Shopping & Retail
+- "RALPHS #0299" → Food & Dining (grocery store)
+- "Netflix" → Subscriptions & Digital Services
+- "Verizon Wireless" → Utilities & Bills (phone service)
+
+Respond ONLY with a JSON array of category names in the EXACT order of transactions, no additional text.
+Example format: ["Food & Dining", "Transportation", "Shopping & Retail"]"""
+
+# Summary/total rows to skip, matched against the upper-cased date and description cells
+_DATE_SKIP_RE = re.compile(r'TOTAL|SUMMARY|BALANCE|OPENING|CLOSING')
+_DESCRIPTION_SKIP_RE = re.compile(r'TOTAL|SUMMARY|MONTHLY')
+
+def _to_float(value):
+    """Parse an amount cell; numeric cells skip the str()/replace() round-trip"""
+    if type(value) in (int, float):
+        return float(value)
+    return float(str(value).replace(',', ''))
+
+def _has_amount(value):
+    """True unless the cell is empty or a placeholder such as '-'"""
+    if type(value) in (int, float):
+        return value != 0
+    return bool(value) and str(value).strip() not in ('', '-', 'None')
+
+class _CalamineSheet:
+    """Rows parsed by python-calamine behind the part of openpyxl's worksheet API used here"""
+    def __init__(self, rows):
+        self._rows = rows
+
+    def reset_dimensions(self):
+        pass
+
+    def iter_rows(self, min_row=1, max_row=None, max_col=None, values_only=True):
+        # Empty cells come back as '' rather than None; both are falsy for every check below
+        for row in islice(self._rows, min_row - 1, max_row):
+            if max_col is not None:
+                row = row[:max_col] if len(row) >= max_col else row + [None] * (max_col - len(row))
+            yield tuple(row)
+
+class _CalamineWorkbook:
+    """Workbook parsed by python-calamine (native), exposing sheetnames/[]/close like openpyxl"""
+    def __init__(self, path):
+        self._workbook = CalamineWorkbook.from_path(path)
+        self.sheetnames = self._workbook.sheet_names
+
+    def __getitem__(self, sheet_name):
+        # Keep leading empty rows/columns so row and column numbers match the sheet
+        return _CalamineSheet(self._workbook.get_sheet_by_name(sheet_name).to_python(skip_empty_area=False))
+
+    def close(self):
+        pass
+
 class UAEBankExcelProcessor:
+    _BANK_DISPLAY = {
+        'ADCB': 'Abu Dhabi Commercial Bank',
+        'FAB': 'First Abu Dhabi Bank',
+        'ENBD': 'Emirates NBD',
+        'MASHREQ': 'Mashreq Bank',
+        'CBD': 'Commercial Bank of Dubai',
+        'HSBC': 'HSBC Bank Middle East',
+        'RAKBANK': 'RAKBank',
+        'ADIB': 'Abu Dhabi Islamic Bank',
+        'BOA': 'Bank of America',
+        'CHASE': 'Chase Bank',
+        'WELLS': 'Wells Fargo',
+        'CITI': 'Citibank'
+    }
+
+    # Priority-based categorization for better accuracy
+    _CATEGORY_PRIORITY = (
+        'ATM & Cash Withdrawals',
+        'Subscriptions & Digital Services',
+        'Food & Dining',
+        'Transportation',
+        'Healthcare',
+        'Utilities & Bills',
+        'Entertainment',
+        'Shopping & Retail',
+        'Personal Care',
+        'Banking & Finance'
+    )
+
+    # Additional validation for specific categories: a keyword hit only counts
+    # if one of these terms is also present (every ATM keyword already
+    # contains 'atm', 'withdrawal' or 'cash', so it needs no gate)
+    _CATEGORY_GATES = {
+        'Subscriptions & Digital Services': ['subscription', 'monthly', 'netflix', 'spotify', 'prime', 'office', 'adobe', 'google', 'microsoft', 'icloud'],
+        # Only categorize as banking if it's clearly a bank transaction
+        'Banking & Finance': ['transfer', 'fee', 'charge', 'interest', 'maintenance']
+    }
+
+    # Unambiguous merchant names: a rule-based match confirmed by one of these
+    # is trusted as-is and not sent to the AI for re-categorization
+    _CONFIDENT_MERCHANTS = {
+        'ATM & Cash Withdrawals': ['atm withdrawal', 'cash withdrawal'],
+        'Subscriptions & Digital Services': ['netflix', 'spotify', 'icloud', 'adobe', 'office 365'],
+        'Food & Dining': [
+            'starbucks', 'mcdonald', 'kfc', 'dominos', 'talabat', 'zomato', 'deliveroo', 'doordash',
+            'grubhub', 'uber eats', 'chipotle', 'carrefour', 'spinneys', 'whole foods', 'ralphs', 'kroger', 'safeway'
+        ],
+        'Transportation': ['careem', 'adnoc', 'enoc', 'eppco', 'salik', 'chevron', 'exxon', 'lyft'],
+        'Healthcare': ['mediclinic', 'aster pharmacy', 'life pharmacy'],
+        'Utilities & Bills': ['dewa', 'addc', 'etisalat'],
+        'Shopping & Retail': ['ikea', 'sharaf dg', 'uniqlo', 'zara', 'best buy', 'nordstrom'],
+        'Personal Care': ['24hourfitness', 'planet fitness', 'orangetheory']
+    }
+
+    # Date formats, compiled once
+    _SLASH_DATE_4Y_RE = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{4})$')
+    _SLASH_DATE_2Y_RE = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{2})$')
+    _ISO_DATE_RE = re.compile(r'^(\d{4})-(\d{1,2})-(\d{1,2})$')
+
     def __init__(self):
         self.bank_patterns = {
             'ADCB': ['abu dhabi commercial bank', 'adcb'],
@@ -101,271 +349,150 @@ class UAEBankExcelProcessor:
             ]
         }
 
+        # One compiled keyword trie per category replaces the per-keyword substring scans
+        self._category_matchers = [
+            (
+                category,
+                self._compile_terms(self.categories[category]),
+                self._compile_terms(self._CATEGORY_GATES[category]) if category in self._CATEGORY_GATES else None
+            )
+            for category in self._CATEGORY_PRIORITY
+        ]
+
+        self._confident_merchant_res = {
+            category: re.compile(r'\b(?:' + '|'.join(re.escape(merchant) for merchant in merchants) + r')\b')
+            for category, merchants in self._CONFIDENT_MERCHANTS.items()
+        }
+
+        # Statements repeat the same descriptions many times; memoize the keyword scan
+        self._categorize_cached = lru_cache(maxsize=4096)(self._categorize)
+
+    @staticmethod
+    def _compile_terms(terms):
+        """Compile plain substrings into a single prefix-factored (trie) regex"""
+        return re.compile(trie_pattern(terms))
+
     def detect_bank(self, text):
         """Detect bank from text content"""
+        # Plain substring checks in declaration order: the first listed bank wins
         text_lower = text.lower()
         for bank_code, patterns in self.bank_patterns.items():
             for pattern in patterns:
                 if pattern in text_lower:
-                    return {
-                        'ADCB': 'Abu Dhabi Commercial Bank',
-                        'FAB': 'First Abu Dhabi Bank',
-                        'ENBD': 'Emirates NBD',
-                        'MASHREQ': 'Mashreq Bank',
-                        'CBD': 'Commercial Bank of Dubai',
-                        'HSBC': 'HSBC Bank Middle East',
-                        'RAKBANK': 'RAKBank',
-                        'ADIB': 'Abu Dhabi Islamic Bank',
-                        'BOA': 'Bank of America',
-                        'CHASE': 'Chase Bank',
-                        'WELLS': 'Wells Fargo',
-                        'CITI': 'Citibank'
-                    }.get(bank_code, f'{bank_code} Bank')
+                    return self._BANK_DISPLAY[bank_code]
         return 'Unknown Bank'
 
     def categorize_transaction(self, description):
         """Enhanced categorization with priority matching and better logic"""
-        desc_lower = description.lower().strip()
-
-        # Priority-based categorization for better accuracy
-        category_priority = [
-            'ATM & Cash Withdrawals',
-            'Subscriptions & Digital Services',
-            'Food & Dining',
-            'Transportation',
-            'Healthcare',
-            'Utilities & Bills',
-            'Entertainment',
-            'Shopping & Retail',
-            'Personal Care',
-            'Banking & Finance'
-        ]
+        return self._categorize_cached(description)[0]
 
-        # Check for exact matches first
-        for category in category_priority:
-            keywords = self.categories[category]
-            for keyword in keywords:
-                if keyword in desc_lower:
-                    # Additional validation for specific categories
-                    if category == 'ATM & Cash Withdrawals':
-                        if any(term in desc_lower for term in ['atm', 'withdrawal', 'cash']):
-                            return category
-                    elif category == 'Subscriptions & Digital Services':
-                        if any(term in desc_lower for term in ['subscription', 'monthly', 'netflix', 'spotify', 'prime', 'office', 'adobe', 'google', 'microsoft', 'icloud']):
-                            return category
-                    elif category == 'Banking & Finance':
-                        # Only categorize as banking if it's clearly a bank transaction
-                        if any(term in desc_lower for term in ['transfer', 'fee', 'charge', 'interest', 'maintenance']):
-                            return category
-                    else:
-                        return category
-
-        # Additional pattern matching for common transaction types
-        if any(word in desc_lower for word in ['taxi', 'uber', 'careem', 'rta']):
-            return 'Transportation'
-
-        if any(word in desc_lower for word in ['restaurant', 'cafe', 'food', 'dining', 'eat']):
-            return 'Food & Dining'
-
-        if any(word in desc_lower for word in ['mall', 'shop', 'store', 'retail']):
-            return 'Shopping & Retail'
-
-        # Check for merchant names and common patterns
-        merchant_patterns = {
-            'CAREEM': 'Transportation',
-            'TALABAT': 'Food & Dining',
-            'ZOMATO': 'Food & Dining',
-            'NETFLIX': 'Subscriptions & Digital Services',
-            'SPOTIFY': 'Subscriptions & Digital Services',
-            'AMAZON': 'Shopping & Retail',
-            'NOON': 'Shopping & Retail',
-            'ADNOC': 'Transportation',
-            'ENOC': 'Transportation',
-            'EPPCO': 'Transportation'
-        }
+    def categorize_with_confidence(self, description):
+        """(category, confident): confident when a known merchant for that category is named"""
+        return self._categorize_cached(description)
 
-        for merchant, cat in merchant_patterns.items():
-            if merchant.lower() in desc_lower:
-                return cat
+    def _categorize(self, description):
+        """Uncached keyword scan behind categorize_transaction"""
+        desc_lower = description.lower()
 
-        return 'Other Expenses'
+        # Categories are checked in priority order; gated categories also need a confirming term
+        for category, keyword_re, gate_re in self._category_matchers:
+            if keyword_re.search(desc_lower) and (gate_re is None or gate_re.search(desc_lower)):
+                merchant_re = self._confident_merchant_res.get(category)
+                return category, bool(merchant_re and merchant_re.search(desc_lower))
+
+        return 'Other Expenses', False
 
     def ai_categorize_transactions(self, transactions):
         """Use AI to intelligently categorize transactions in batches"""
-        if not openai.api_key or not transactions:
-            return transactions
-
-        # Define available categories
-        categories = [
-            'Food & Dining',
-            'Transportation',
-            'Shopping & Retail',
-            'Healthcare',
-            'Utilities & Bills',
-            'Entertainment',
-            'Subscriptions & Digital Services',
-            'ATM & Cash Withdrawals',
-            'Banking & Finance',
-            'Personal Care',
-            'Travel',
-            'Income',
-            'Other Expenses'
-        ]
-
-        try:
-            # Process in batches of 50 transactions
-            batch_size = 50
-            categorized_transactions = []
-
-            for i in range(0, len(transactions), batch_size):
-                batch = transactions[i:i + batch_size]
-
-                # Prepare batch for AI
-                descriptions = [f"{idx}. {tx['Description']}" for idx, tx in enumerate(batch, start=i)]
-
-                prompt = f"""Categorize these financial transactions into the most appropriate category. READ THE DESCRIPTION CAREFULLY and categorize accurately.
-
-Available categories: {', '.join(categories)}
-
-STRICT Category Rules - Follow These Examples:
-
-1. Food & Dining - RESTAURANTS, CAFES, GROCERY STORES:
-   ✓ CAVA, Chipotle, McDonald's, Panera, Five Guys, In-N-Out
-   ✓ Starbucks, Coffee Bean, Dutch Bros, any coffee shop
-   ✓ Ralphs, Kroger, Safeway, Albertsons, Vons, Whole Foods, Trader Joe's, Target (food section), Walmart (food section)
-   ✓ DoorDash, UberEats, Grubhub, Postmates
-   ✓ Bakeries, donut shops, butcher shops, delis
-   ✓ SQ *BACIO DI LATTE, SQ *MARU ESPRESSO BAR, DD *DOORDASH
-
-2. Transportation - GAS, PARKING, RIDESHARE:
-   ✓ Chevron, Shell, Mobil, BP, 76, Exxon, Texaco
-   ✓ Uber (rides), Lyft, taxi services
-   ✓ LAX parking, valet parking, parking services, parking meters
-   ✓ Toll roads, FasTrak, E-ZPass
-   ✓ Car wash, auto services
-   ✗ NOT food delivery apps
+        ai_categories = self.ai_categorize_descriptions([tx['Description'] for tx in transactions])
 
-3. Utilities & Bills - PHONE, INTERNET, ELECTRICITY:
-   ✓ Verizon, AT&T, T-Mobile, Sprint
-   ✓ Comcast, Spectrum, Cox Internet
-   ✓ Electric company, water company, gas utility
-   ✗ NOT Rocket Money (that's Subscriptions & Digital Services)
+        # Apply AI categories; transactions without one keep their rule-based category
+        for tx, category in zip(transactions, ai_categories):
+            if category:
+                tx['Category'] = category
+                tx['Subcategory'] = _subcategory(category)
 
-4. Subscriptions & Digital Services - MONTHLY RECURRING SERVICES:
-   ✓ Netflix, Hulu, Disney+, HBO Max, Amazon Prime Video
-   ✓ Spotify, YouTube Premium, Apple Music
-   ✓ Rocket Money, Mint, YNAB (budgeting apps)
-   ✓ Adobe Creative Cloud, Microsoft Office 365, Dropbox
-   ✓ Amazon Prime membership, Costco membership
-   ✓ Any app subscription, cloud storage, SaaS
+        return transactions
 
-5. Personal Care - GYM, SALON, SPA:
-   ✓ 24HourFitness, Planet Fitness, LA Fitness, Gold's Gym, Flex Fitness
-   ✓ Hair salons, barbershops, nail salons
-   ✓ Spa services, massage therapy
-   ✓ Beauty products, cosmetics (if from beauty store)
+    def ai_categorize_descriptions(self, descriptions):
+        """AI category for each description, or None where the AI gave none"""
+        if not openai.api_key or not descriptions:
+            return [None] * len(descriptions)
 
-6. Entertainment - MOVIES, EVENTS, ATTRACTIONS:
-   ✓ Movie theaters (AMC, Regal), concerts, sports events
-   ✓ Theme parks (Disneyland, Six Flags), museums (Balloon Museum)
-   ✓ Festivals (Sawdust Festival), entertainment venues
-
-7. Banking & Finance - BANK FEES, TRANSFERS:
-   ✓ Zelle payments, wire transfers, bank transfers
-   ✓ Bank fees, service charges, overdraft fees
-   ✓ Foreign transaction fees, ATM fees (if separate from withdrawal)
-   ✗ NOT ATM withdrawals (that's ATM & Cash Withdrawals)
-
-8. Shopping & Retail - CLOTHING, ELECTRONICS, GENERAL MERCHANDISE:
-   ✓ Uniqlo, H&M, Zara, Nike, Adidas (clothing)
-   ✓ Target (non-food), Walmart (non-food), Amazon (general)
-   ✓ Best Buy, Apple Store (electronics)
-   ✗ NOT grocery stores
-
-9. ATM & Cash Withdrawals:
-   ✓ ATM Withdrawal, Cash Advance, ATM cash
-   ✗ Nothing else
+        try:
+            # Statements repeat the same merchants many times: only unique,
+            # not-yet-cached descriptions are sent to the model
+            keys = [normalize_description(description) for description in descriptions]
+            category_by_key = get_cached_categories('excel', keys)
+            pending = {}
+            for key, description in zip(keys, descriptions):
+                if key not in category_by_key:
+                    pending.setdefault(key, description)
+            pending_keys = list(pending)
+            pending_descriptions = list(pending.values())
+
+            # Process in batches of 50 descriptions; batches are independent
+            # requests, so they are sent concurrently and reassembled in order
+            batch_size = 50
+            starts = range(0, len(pending_descriptions), batch_size)
+
+            if pending_descriptions:
+                with ThreadPoolExecutor(max_workers=min(AI_CATEGORIZE_WORKERS, len(starts))) as executor:
+                    futures = [
+                        executor.submit(self._ai_categorize_batch, pending_descriptions[i:i + batch_size], i)
+                        for i in starts
+                    ]
+                    batch_categories = {}
+                    for i, future in zip(starts, futures):
+                        for offset, category in enumerate(future.result()):
+                            batch_categories[pending_keys[i + offset]] = category
+                store_cached_categories('excel', batch_categories)
+                category_by_key.update(batch_categories)
+
+            return [category_by_key.get(key) for key in keys]
 
-10. Income:
-   ✓ Salary, paycheck deposits, direct deposits
-   ✓ Refunds, reimbursements, tax refunds
-   ✓ Money received (NOT sent)
+        except Exception as e:
+            print(f"AI categorization failed: {str(e)}")
+            return [None] * len(descriptions)
 
-11. Travel:
-   ✓ Hotels, Airbnb, Booking.com
-   ✓ Airlines (United, Delta, Southwest)
-   ✓ Rental cars (Hertz, Enterprise)
+    def _ai_categorize_batch(self, batch, i):
+        """Categorize one batch of descriptions with OpenAI; returns [] on error"""
+        # Prepare batch for AI
+        descriptions = [f"{idx}. {description}" for idx, description in enumerate(batch, start=i)]
 
-12. Healthcare:
-   ✓ Hospitals, clinics, doctor visits
-   ✓ Pharmacies (CVS, Walgreens for prescriptions)
-   ✓ Dental, vision care
+        prompt = "Categorize these transactions; respond with a JSON array in order:\n" + "\n".join(descriptions)
 
-13. Other Expenses:
-   ✓ ONLY use this if truly unidentifiable
+        try:
+            response = openai.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": _SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=len(batch) * 12,  # roughly one category name per transaction
+                temperature=0.1
+            )
 
-CRITICAL EXAMPLES TO LEARN FROM:
-- "Rocket Money DES" → Subscriptions & Digital Services (budgeting app, NOT utilities)
-- "SQ *BACIO DI LATTE" → Food & Dining (coffee shop)
-- "CHECKCARD A PARKING SERVICES" → Transportation (parking)
-- "24HourFitness" → Personal Care (gym)
-- "Zelle payment to Bryan" → Banking & Finance (transfer)
-- "TARGET ST 4255" → Check description - food items = Food & Dining, else Shopping & Retail
-- "RALPHS #0299" → Food & Dining (grocery store)
-- "Netflix" → Subscriptions & Digital Services
-- "Verizon Wireless" → Utilities & Bills (phone service)
+            ai_response = response.choices[0].message.content.strip()
 
-Transactions to categorize:
-{chr(10).join(descriptions[:30])}
+            # Remove markdown if present
+            if ai_response.startswith('```json'):
+                ai_response = ai_response.replace('```json', '').replace('```', '').strip()
+            elif ai_response.startswith('```'):
+                ai_response = ai_response.replace('```', '').strip()
 
-Respond ONLY with a JSON array of category names in the EXACT order of transactions, nothing else.
-Example format: ["Food & Dining", "Transportation", "Shopping & Retail"]"""
+            ai_categories = orjson.loads(ai_response) if ORJSON_AVAILABLE else json.loads(ai_response)
 
-                try:
-                    response = openai.chat.completions.create(
-                        model="gpt-4o-mini",
-                        messages=[
-                            {
-                                "role": "system",
-                                "content": "You are a financial categorization expert. Respond only with a JSON array of categories, no additional text."
-                            },
-                            {"role": "user", "content": prompt}
-                        ],
-                        max_tokens=500,
-                        temperature=0.1
-                    )
-
-                    ai_response = response.choices[0].message.content.strip()
-
-                    # Remove markdown if present
-                    if ai_response.startswith('```json'):
-                        ai_response = ai_response.replace('```json', '').replace('```', '').strip()
-                    elif ai_response.startswith('```'):
-                        ai_response = ai_response.replace('```', '').strip()
-
-                    ai_categories = json.loads(ai_response)
-
-                    # Apply AI categories to batch
-                    for idx, tx in enumerate(batch):
-                        if idx < len(ai_categories):
-                            tx['Category'] = ai_categories[idx]
-                            tx['Subcategory'] = ai_categories[idx].split(' ')[0]
-                        categorized_transactions.append(tx)
-
-                except Exception as e:
-                    print(f"AI categorization error for batch: {str(e)}")
-                    # Fallback to rule-based for this batch
-                    for tx in batch:
-                        categorized_transactions.append(tx)
-
-            return categorized_transactions
+            # Only well-formed category names are kept, in batch order
+            return [category if isinstance(category, str) else None for category in ai_categories[:len(batch)]]
 
         except Exception as e:
-            print(f"AI categorization failed: {str(e)}")
-            return transactions
+            print(f"AI categorization error for batch: {str(e)}")
+            # Fallback to rule-based for this batch
+            return []
 
-    def extract_bank_info(self, worksheet):
-        """Extract bank information from worksheet"""
+    def extract_bank_info(self, rows):
+        """Extract bank information from a worksheet's leading rows (value tuples)"""
         bank_info = {
             'bank_name': 'UAE Bank',
             'account_holder': 'Account Holder',
@@ -374,9 +501,9 @@ Example format: ["Food & Dining", "Transportation", "Shopping & Retail"]"""
         }
 
         # Check first 20 rows for bank information
-        for row in range(1, min(21, worksheet.max_row + 1)):
-            for col in range(1, min(10, worksheet.max_column + 1)):
-                cell_value = str(worksheet.cell(row, col).value or '').upper()
+        for row_values in islice(rows, 20):
+            for value in row_values[:9]:
+                cell_value = str(value or '').upper()
 
                 # Detect bank
                 bank_name = self.detect_bank(cell_value)
@@ -396,16 +523,16 @@ Example format: ["Food & Dining", "Transportation", "Shopping & Retail"]"""
 
         return bank_info
 
-    def find_data_headers(self, worksheet):
-        """Find the row with data headers and detect column mappings"""
+    def find_data_headers(self, rows):
+        """Find the row with data headers among a worksheet's leading rows (value tuples) and detect column mappings"""
         header_keywords = ['date', 'amount', 'description', 'particular', 'narration', 'debit', 'credit', 'balance', 'type', 'reference']
 
-        for row in range(1, min(20, worksheet.max_row + 1)):
+        for row, row_values in enumerate(islice(rows, 19), start=1):
             row_data = {}
             header_count = 0
 
-            for col in range(1, min(worksheet.max_column + 1, 10)):  # Check up to 10 columns
-                cell_value = str(worksheet.cell(row, col).value or '').lower().strip()
+            for col, value in enumerate(row_values[:9], start=1):  # Check up to 10 columns
+                cell_value = str(value or '').lower().strip()
 
                 # Map common header variations
                 if cell_value and any(keyword in cell_value for keyword in header_keywords):
@@ -435,59 +562,69 @@ Example format: ["Food & Dining", "Transportation", "Shopping & Retail"]"""
         # Default mapping if no headers found
         return {'header_row': 1, 'date_col': 1, 'description_col': 2, 'debit_col': 4, 'credit_col': 5}
 
-    def detect_date_format(self, date_string):
-        """Detect and parse date from various formats"""
+    def detect_date_format(self, date_string, day_first=True):
+        """Detect and parse date from various formats; day_first picks DD/MM over MM/DD for 4-digit years"""
         if isinstance(date_string, datetime):
             return date_string.strftime('%Y-%m-%d')
 
         date_str = str(date_string).strip()
 
-        # Try multiple date format patterns
-        patterns = [
-            # DD/MM/YYYY (UAE format)
-            (r'^(\d{1,2})/(\d{1,2})/(\d{4})$', lambda m: f"{m.group(3)}-{m.group(2).zfill(2)}-{m.group(1).zfill(2)}"),
-            # MM/DD/YY (US format - 2 digit year)
-            (r'^(\d{1,2})/(\d{1,2})/(\d{2})$', lambda m: f"20{m.group(3)}" if int(m.group(3)) < 50 else f"19{m.group(3)}" + f"-{m.group(1).zfill(2)}-{m.group(2).zfill(2)}"),
-            # MM/DD/YYYY (US format - 4 digit year)
-            (r'^(\d{1,2})/(\d{1,2})/(\d{4})$', lambda m: f"{m.group(3)}-{m.group(1).zfill(2)}-{m.group(2).zfill(2)}"),
-            # YYYY-MM-DD (ISO format)
-            (r'^(\d{4})-(\d{1,2})-(\d{1,2})$', lambda m: f"{m.group(1)}-{m.group(2).zfill(2)}-{m.group(3).zfill(2)}"),
-        ]
-
-        for pattern, formatter in patterns:
-            match = re.match(pattern, date_str)
-            if match:
-                try:
-                    # Special handling for MM/DD/YY format
-                    if pattern == r'^(\d{1,2})/(\d{1,2})/(\d{2})$':
-                        month, day, year = match.group(1), match.group(2), match.group(3)
-                        full_year = '20' + year if int(year) < 50 else '19' + year
-                        return f"{full_year}-{month.zfill(2)}-{day.zfill(2)}"
-                    else:
-                        return formatter(match)
-                except:
-                    continue
+        # DD/MM/YYYY (UAE format) or MM/DD/YYYY (US format - 4 digit year)
+        match = self._SLASH_DATE_4Y_RE.match(date_str)
+        if match:
+            first, second, year = match.groups()
+            # An impossible month settles the order; otherwise use the statement's convention
+            if int(first) > 12 or (day_first and int(second) <= 12):
+                day, month = first, second
+            else:
+                month, day = first, second
+            return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+
+        # MM/DD/YY (US format - 2 digit year)
+        match = self._SLASH_DATE_2Y_RE.match(date_str)
+        if match:
+            month, day, year = match.groups()
+            full_year = '20' + year if int(year) < 50 else '19' + year
+            return f"{full_year}-{month.zfill(2)}-{day.zfill(2)}"
+
+        # YYYY-MM-DD (ISO format)
+        match = self._ISO_DATE_RE.match(date_str)
+        if match:
+            year, month, day = match.groups()
+            return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
 
         # Fallback to current year if parsing fails
         return datetime.now().strftime('%Y-%m-%d')
 
+    def _open_workbook(self, file_content):
+        """Open with python-calamine when installed and given a path, else openpyxl"""
+        if CALAMINE_AVAILABLE and isinstance(file_content, (str, os.PathLike)):
+            try:
+                return _CalamineWorkbook(file_content)
+            except Exception as e:
+                print(f"[WARN] calamine could not read the workbook, falling back to openpyxl: {str(e)}")
+
+        # Load workbook in streaming read-only mode, with cached formula results as values
+        return load_workbook(file_content, read_only=True, data_only=True)
+
     def process_excel_file(self, file_content):
         """Dynamic Excel processor - automatically detects and adapts to different Excel formats"""
         if not EXCEL_AVAILABLE:
             return None, "openpyxl not available - using demo data"
 
+        workbook = None
         try:
-            # Load workbook
-            workbook = load_workbook(file_content)
+            workbook = self._open_workbook(file_content)
             print(f"[*] Processing Excel file with {len(workbook.sheetnames)} sheets")
 
             # Extract bank info from Account Info sheet
             bank_info = {'bank_name': 'Unknown Bank', 'account_holder': 'Account Holder', 'account_number': 'XXXX-XXXX-XXXX', 'currency': 'USD'}
             if 'Account Info' in workbook.sheetnames:
                 info_sheet = workbook['Account Info']
-                for row in range(1, info_sheet.max_row + 1):
-                    field = str(info_sheet.cell(row, 1).value or '').lower()
-                    value = str(info_sheet.cell(row, 2).value or '')
+                info_sheet.reset_dimensions()  # stored dimensions can be stale; read to the last row
+                for field_cell, value_cell in info_sheet.iter_rows(max_col=2, values_only=True):
+                    field = str(field_cell or '').lower()
+                    value = str(value_cell or '')
                     if 'account holder' in field and value:
                         bank_info['account_holder'] = value
                     elif 'account number' in field and value:
@@ -504,16 +641,27 @@ Example format: ["Food & Dining", "Transportation", "Shopping & Retail"]"""
 
             print(f"[BANK] {bank_info['bank_name']} | Currency: {bank_info['currency']}")
 
-            # Process transaction sheets (all sheets except Account Info)
-            all_transactions = []
+            # US banks write dates month-first; UAE and unidentified banks day-first
+            day_first = bank_info['currency'] != 'USD' or bank_info['bank_name'] == 'Unknown Bank'
+
+            # Process transaction sheets (all sheets except Account Info); transactions
+            # are collected column-wise and only turned into dicts at the end
+            dates, amounts, descriptions, categories, confident = [], [], [], [], []
             transaction_sheets = [sheet for sheet in workbook.sheetnames if sheet != 'Account Info']
 
             for sheet_name in transaction_sheets:
                 worksheet = workbook[sheet_name]
+                worksheet.reset_dimensions()  # stored dimensions can be stale; read to the last row
                 print(f"\n[SHEET] Processing: {sheet_name}")
 
+                # Single pass over the sheet: the leading rows are buffered for
+                # header detection, then the same row stream continues into the
+                # transaction loop
+                rows_iter = worksheet.iter_rows(values_only=True)
+                leading_rows = list(islice(rows_iter, 19))
+
                 # DYNAMIC HEADER DETECTION - automatically find headers and column mappings
-                column_map = self.find_data_headers(worksheet)
+                column_map = self.find_data_headers(leading_rows)
                 header_row = column_map.get('header_row', 1)
                 date_col = column_map.get('date_col', 1)
                 desc_col = column_map.get('description_col', 2)
@@ -524,39 +672,46 @@ Example format: ["Food & Dining", "Transportation", "Shopping & Retail"]"""
                 print(f"  [OK] Headers found at row {header_row}")
                 print(f"  [OK] Columns: Date={date_col}, Desc={desc_col}, Debit={debit_col}, Credit={credit_col}")
 
-                # Process transactions starting from row after headers
+                # Process transactions starting from row after headers, reading
+                # plain value tuples wide enough to cover every mapped column
+                last_col = max(date_col, desc_col, debit_col, credit_col, amount_col or 0)
+                # Zero-based tuple positions, resolved once per sheet
+                read_cells = itemgetter(date_col - 1, desc_col - 1, debit_col - 1, credit_col - 1)
+                amount_idx = amount_col - 1 if amount_col else None
                 sheet_transactions = 0
-                for row in range(header_row + 1, worksheet.max_row + 1):
+                for row_values in chain(leading_rows[header_row:], rows_iter):
                     try:
+                        # Streamed rows end at their last non-empty cell; pad to the mapped columns
+                        if len(row_values) < last_col:
+                            row_values = (*row_values, *(None,) * (last_col - len(row_values)))
+
                         # DYNAMIC CELL READING - read based on detected column positions
-                        date_cell = worksheet.cell(row, date_col).value if date_col else None
-                        description_cell = worksheet.cell(row, desc_col).value if desc_col else None
-                        debit_cell = worksheet.cell(row, debit_col).value if debit_col else None
-                        credit_cell = worksheet.cell(row, credit_col).value if credit_col else None
+                        date_cell, description_cell, debit_cell, credit_cell = read_cells(row_values)
 
                         # Skip empty rows or summary rows
                         if not date_cell:
                             continue
-                        if any(keyword in str(date_cell).upper() for keyword in ['TOTAL', 'SUMMARY', 'BALANCE', 'OPENING', 'CLOSING']):
+                        if not isinstance(date_cell, datetime) and _DATE_SKIP_RE.search(str(date_cell).upper()):
                             continue
-                        if description_cell and any(keyword in str(description_cell).upper() for keyword in ['TOTAL', 'SUMMARY', 'MONTHLY']):
+                        description_text = str(description_cell) if description_cell else None
+                        if description_text and _DESCRIPTION_SKIP_RE.search(description_text.upper()):
                             continue
 
                         # INTELLIGENT DATE PARSING - automatically detect and parse date format
-                        date_str = self.detect_date_format(date_cell)
+                        date_str = self.detect_date_format(date_cell, day_first)
 
                         # DYNAMIC AMOUNT EXTRACTION - handle both debit/credit and single amount columns
                         amount = 0
                         try:
-                            if amount_col:
+                            if amount_idx is not None:
                                 # Single amount column
-                                amount = float(str(worksheet.cell(row, amount_col).value or '0').replace(',', ''))
+                                amount = _to_float(row_values[amount_idx] or 0)
                             else:
                                 # Debit/Credit columns
-                                if debit_cell and str(debit_cell).strip() and str(debit_cell).strip() not in ['', '-', 'None']:
-                                    amount = -abs(float(str(debit_cell).replace(',', '')))  # Debits are negative
-                                elif credit_cell and str(credit_cell).strip() and str(credit_cell).strip() not in ['', '-', 'None']:
-                                    amount = abs(float(str(credit_cell).replace(',', '')))  # Credits are positive
+                                if _has_amount(debit_cell):
+                                    amount = -abs(_to_float(debit_cell))  # Debits are negative
+                                elif _has_amount(credit_cell):
+                                    amount = abs(_to_float(credit_cell))  # Credits are positive
                         except (ValueError, TypeError):
                             continue
 
@@ -565,19 +720,16 @@ Example format: ["Food & Dining", "Transportation", "Shopping & Retail"]"""
                             continue
 
                         # Process description
-                        description = str(description_cell).strip() if description_cell else f"Transaction {len(all_transactions) + 1}"
+                        description = description_text.strip() if description_text else f"Transaction {len(dates) + 1}"
 
                         # Categorize transaction (will be improved by AI later)
-                        category = self.categorize_transaction(description)
-
-                        transaction = {
-                            'Date': date_str,
-                            'Amount': amount,
-                            'Description': description,
-                            'Category': category,
-                            'Subcategory': category.split(' ')[0] if category != 'Other Expenses' else 'Miscellaneous'
-                        }
-                        all_transactions.append(transaction)
+                        category, is_confident = self.categorize_with_confidence(description)
+
+                        dates.append(date_str)
+                        amounts.append(amount)
+                        descriptions.append(description)
+                        categories.append(category)
+                        confident.append(is_confident)
                         sheet_transactions += 1
 
                     except Exception as e:
@@ -585,14 +737,27 @@ Example format: ["Food & Dining", "Transportation", "Shopping & Retail"]"""
 
                 print(f"  [OK] Extracted {sheet_transactions} transactions from {sheet_name}")
 
-            print(f"\n[SUCCESS] Total transactions extracted: {len(all_transactions)}")
+            print(f"\n[SUCCESS] Total transactions extracted: {len(dates)}")
+
+            subcategories = [_SUBCATEGORY[category] for category in categories]
 
-            # Apply AI-powered categorization to improve accuracy
-            if len(all_transactions) > 0:
-                print(f"[AI] Applying AI categorization to {len(all_transactions)} transactions...")
-                all_transactions = self.ai_categorize_transactions(all_transactions)
+            # Apply AI-powered categorization to improve accuracy, skipping
+            # transactions already matched to a known merchant
+            needs_ai = [idx for idx, is_confident in enumerate(confident) if not is_confident]
+            if len(needs_ai) > 0:
+                print(f"[AI] Applying AI categorization to {len(needs_ai)} of {len(descriptions)} transactions...")
+                ai_categories = self.ai_categorize_descriptions([descriptions[idx] for idx in needs_ai])
+                for idx, ai_category in zip(needs_ai, ai_categories):
+                    if ai_category:
+                        categories[idx] = ai_category
+                        subcategories[idx] = _subcategory(ai_category)
                 print(f"[AI] AI categorization complete!")
 
+            all_transactions = [
+                {'Date': date_str, 'Amount': amount, 'Description': description, 'Category': category, 'Subcategory': subcategory}
+                for date_str, amount, description, category, subcategory in zip(dates, amounts, descriptions, categories, subcategories)
+            ]
+
             return {
                 'transactions': all_transactions,
                 'bank_info': bank_info,
@@ -606,5 +771,10 @@ Example format: ["Food & Dining", "Transportation", "Shopping & Retail"]"""
             traceback.print_exc()
             return None, f"Error processing Excel file: {str(e)}"
 
+        finally:
+            # Read-only workbooks keep the file open until closed
+            if workbook is not None:
+                workbook.close()
+
 # Global processor instance
 processor = UAEBankExcelProcessor()
\ No newline at end of file
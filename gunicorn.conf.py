@@ -0,0 +1,15 @@
+"""
+Gunicorn configuration for the Universal Finance Analytics API
+Requests spend most of their time waiting on OpenAI, so each worker runs a
+thread pool and keeps serving other requests while those calls are in flight
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count(), 4)))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+# AI analysis routinely takes several seconds; leave headroom before a worker is recycled
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
@@ -2,12 +2,18 @@
 PDF processor for bank statements with AI-powered extraction
 Supports text-based and image-based PDFs with intelligent data extraction
 """
+import io
 import json
 import re
 from datetime import datetime
 import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import openai
 
+from categorization import get_cached_categories, normalize_description, store_cached_categories, trie_pattern
+
 try:
     import pdfplumber
     PDF_PLUMBER_AVAILABLE = True
@@ -26,90 +32,252 @@ try:
 except ImportError:
     PYMUPDF_AVAILABLE = False
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Set OpenAI API key
 openai.api_key = os.getenv('OPENAI_API_KEY')
 
+# Fewer extracted characters per page than this means a scanned (image-only) statement
+PDF_MIN_CHARS_PER_PAGE = 100
+
+# Concurrent OpenAI requests when categorizing large statements
+AI_CATEGORIZE_WORKERS = max(int(os.getenv('AI_CATEGORIZE_WORKERS', '4')), 1)
+
+# Categories the AI may assign
+_AI_CATEGORIES = [
+    'Food & Dining', 'Transportation', 'Shopping & Retail', 'Healthcare',
+    'Utilities & Bills', 'Entertainment', 'Subscriptions & Digital Services',
+    'ATM & Cash Withdrawals', 'Banking & Finance', 'Personal Care',
+    'Travel', 'Income', 'Other Expenses'
+]
+
+# Subcategory (first word of the category) looked up instead of split per transaction
+_SUBCATEGORY = {
+    category: 'Miscellaneous' if category == 'Other Expenses' else category.split(' ', 1)[0]
+    for category in _AI_CATEGORIES
+}
+
+
+def _subcategory(category):
+    """Subcategory for a category, including names the AI made up"""
+    return _SUBCATEGORY.get(category) or category.split(' ', 1)[0]
+
+
+# Fallback line parsing: ISO dates are tried first so '2024-01-15' is not read as '24-01-15'
+_DATE_RE = re.compile(r'(?P<ymd>\d{4}[/-]\d{1,2}[/-]\d{1,2})|(?P<dmy>\d{1,2}[/-]\d{1,2}[/-]\d{2,4})')
+# A whole statement line containing a date, with its leftmost date captured
+_DATED_LINE_RE = re.compile(r'^.*?(?P<date>' + _DATE_RE.pattern + r').*$', re.MULTILINE)
+_DIGIT_RE = re.compile(r'\d')
+_PAGE_MARKER_RE = re.compile(r'\n--- PAGE (\d+) ---\n')
+_PAGE_NUMBER_LINE_RE = re.compile(r'page\s+\d+(?:\s*(?:of|/)\s*\d+)?', re.IGNORECASE)
+# Column caption rows ('Date Description Debit Credit Balance') reprinted on every page
+_COLUMN_WORD = (r'(?:transaction|value|posting|post|date|description|details|particulars|narration'
+                r'|reference|ref|cheque|chq|no|amount|debits?|credits?|withdrawals?|deposits?|balance|dr|cr)')
+_COLUMN_HEADER_LINE_RE = re.compile(_COLUMN_WORD + r'(?:[\s./|()-]+' + _COLUMN_WORD + r')*[\s.:]*', re.IGNORECASE)
+_WORD_RE = re.compile(r'[a-z]+')
+_CAPTION_DESCRIPTION_WORDS = frozenset(['description', 'details', 'particulars', 'narration'])
+_AMOUNT_RE = re.compile(r'-?\d+[,.]?\d*\.?\d{2}')
+# Description cleanup. One regex pass is as fast as str.translate plus a whitespace
+# split/join, and \d also covers non-ASCII (e.g. Arabic-Indic) digits
+_NONNUM_RE = re.compile(r'[\d/\-,.\s]+')
+_SKIP_LINE_RE = re.compile(r'TOTAL|BALANCE|OPENING|CLOSING|DATE|DESCRIPTION', re.IGNORECASE)
+
+# normalize_date: which strptime formats to try for each date shape
+_DATE_SHAPE_RE = re.compile(r'(?P<slash>\d{1,2}/\d{1,2}/\d{4})|(?P<ymd>\d{4}-\d{1,2}-\d{1,2})|(?P<dmy>\d{1,2}-\d{1,2}-\d{4})')
+_DATE_SHAPE_FORMATS = {
+    'slash': ('%d/%m/%Y', '%m/%d/%Y'),
+    'ymd': ('%Y-%m-%d',),
+    'dmy': ('%d-%m-%Y',),
+}
+
+
+def _is_usable(page_texts):
+    """Enough text, with enough digits for dates and amounts, to be worth parsing.
+    Scanned pages often extract as whitespace or a few stray glyphs"""
+    text = "".join(page_texts)
+    return len(text) > 200 and len(_DIGIT_RE.findall(text)) > 20
+
+
+def _join_pages(page_texts):
+    """Page texts in the '--- PAGE n ---' layout the extraction prompt expects"""
+    return "".join([f"\n--- PAGE {page_num} ---\n{page_text}\n" for page_num, page_text in enumerate(page_texts, 1)])
+
+
+def _is_column_caption(line):
+    """Only column words, at least three of them, including a date and a description column.
+    Lone 'Credit' or 'Debit' lines are transaction types, not captions"""
+    if not _COLUMN_HEADER_LINE_RE.fullmatch(line):
+        return False
+    words = _WORD_RE.findall(line.lower())
+    return len(words) >= 3 and 'date' in words and not _CAPTION_DESCRIPTION_WORDS.isdisjoint(words)
+
+
+def _compact_statement_text(pdf_text):
+    """Statement text for the extraction prompt, without blank lines, page-number footers,
+    repeats of the column caption row, or multi-word, digit-free lines repeated back to back.
+    Lines with digits and single-word lines are always kept: identical transactions can
+    legitimately repeat"""
+    lines = []
+    seen_column_headers = set()
+    for line in pdf_text.split('\n'):
+        line = line.strip()
+        if not line or _PAGE_NUMBER_LINE_RE.fullmatch(line):
+            continue
+        if _is_column_caption(line):
+            header = ' '.join(line.lower().split())
+            if header in seen_column_headers:
+                continue
+            seen_column_headers.add(header)
+        elif lines and line == lines[-1] and len(line.split()) > 1 and not _DIGIT_RE.search(line):
+            continue
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def _reopenable(pdf_source):
+    """A path is opened as-is; in-memory PDF bytes get a fresh stream"""
+    return io.BytesIO(pdf_source) if isinstance(pdf_source, bytes) else pdf_source
+
+
+# Bank name patterns, matched against the lower-cased statement text
+_BANK_PATTERNS = {
+    'ADCB': ['abu dhabi commercial bank', 'adcb'],
+    'FAB': ['first abu dhabi bank', 'fab'],
+    'ENBD': ['emirates nbd', 'enbd'],
+    'MASHREQ': ['mashreq bank', 'mashreq'],
+    'CBD': ['commercial bank of dubai', 'cbd'],
+    'HSBC': ['hsbc'],
+    'RAKBANK': ['rak bank', 'rakbank'],
+    'ADIB': ['abu dhabi islamic bank', 'adib'],
+    'BOA': ['bank of america', 'bofa', 'boa', 'b of a'],
+    'CHASE': ['chase', 'jp morgan chase', 'jpmorgan'],
+    'WELLS': ['wells fargo', 'wells'],
+    'CITI': ['citibank', 'citi'],
+    'BARCLAYS': ['barclays'],
+    'LLOYDS': ['lloyds'],
+    'SBI': ['state bank of india', 'sbi'],
+    'HDFC': ['hdfc bank', 'hdfc'],
+    'ICICI': ['icici bank', 'icici']
+}
+
+# Display names for detected banks
+_BANK_FULLNAMES = {
+    'ADCB': 'Abu Dhabi Commercial Bank',
+    'FAB': 'First Abu Dhabi Bank',
+    'ENBD': 'Emirates NBD',
+    'MASHREQ': 'Mashreq Bank',
+    'CBD': 'Commercial Bank of Dubai',
+    'HSBC': 'HSBC Bank Middle East',
+    'RAKBANK': 'RAKBank',
+    'ADIB': 'Abu Dhabi Islamic Bank',
+    'BOA': 'Bank of America',
+    'CHASE': 'Chase Bank',
+    'WELLS': 'Wells Fargo',
+    'CITI': 'Citibank',
+    'BARCLAYS': 'Barclays',
+    'LLOYDS': 'Lloyds Bank',
+    'SBI': 'State Bank of India',
+    'HDFC': 'HDFC Bank',
+    'ICICI': 'ICICI Bank'
+}
+
+# Keyword lists per spending category, matched as substrings of the lower-cased description
+_CATEGORIES = {
+    'Food & Dining': [
+        'carrefour', 'lulu', 'spinneys', 'choithrams', 'union coop', 'waitrose',
+        'restaurant', 'cafe', 'kfc', 'mcdonald', 'pizza', 'subway', 'dominos',
+        'starbucks', 'costa', 'dunkin', 'burger', 'food', 'dining', 'eat',
+        'grocery', 'supermarket', 'hypermarket', 'bakery', 'deli', 'bistro',
+        'catering', 'takeaway', 'delivery', 'zomato', 'talabat', 'deliveroo',
+        'doordash', 'grubhub', 'uber eats', 'postmates', 'chipotle', 'panera',
+        'whole foods', 'trader joe', 'safeway', 'kroger', 'target', 'walmart',
+        'donuts', 'coffee', 'espresso', 'bacio di latte', 'butchery', 'zinque',
+        'ralphs', 'albertsons', 'vons', 'pavilions', 'publix', 'wegmans'
+    ],
+    'Transportation': [
+        'adnoc', 'eppco', 'enoc', 'petrol', 'fuel', 'gas', 'gasoline',
+        'taxi', 'uber', 'careem', 'metro', 'bus', 'rta', 'parking',
+        'salik', 'toll', 'car wash', 'transport', 'emirates', 'etihad',
+        'flydubai', 'air arabia', 'airline', 'flight', 'airport',
+        'chevron', 'shell', 'bp', '76', 'exxon', 'mobil', 'lyft'
+    ],
+    'Shopping & Retail': [
+        'mall', 'centrepoint', 'max', 'home centre', 'ikea', 'ace',
+        'sharaf dg', 'jumbo', 'electronics', 'clothing', 'fashion',
+        'shop', 'store', 'retail', 'amazon', 'noon', 'souq', 'namshi',
+        'h&m', 'zara', 'nike', 'adidas', 'apple', 'samsung', 'virgin',
+        'uniqlo', 'costco', 'best buy', 'macy', 'nordstrom'
+    ],
+    'Healthcare': [
+        'hospital', 'clinic', 'pharmacy', 'medical', 'doctor', 'health',
+        'dental', 'medicare', 'aster', 'nmc', 'mediclinic', 'life pharmacy',
+        'boots', 'cvs', 'walgreens'
+    ],
+    'Utilities & Bills': [
+        'dewa', 'addc', 'sewa', 'fewa', 'etisalat', 'du', 'internet',
+        'mobile', 'telecom', 'electricity', 'water', 'utility', 'bill',
+        'wifi', 'broadband', 'verizon', 'at&t', 't-mobile'
+    ],
+    'Entertainment': [
+        'cinema', 'movie', 'vox', 'reel', 'netflix', 'osn', 'gaming',
+        'entertainment', 'park', 'beach', 'attraction', 'ticket', 'event',
+        'spotify', 'youtube', 'disney', 'hulu', 'disneyland'
+    ],
+    'Subscriptions & Digital Services': [
+        'netflix', 'spotify', 'youtube premium', 'amazon prime', 'disney+',
+        'adobe', 'microsoft', 'google', 'icloud', 'dropbox', 'zoom',
+        'subscription', 'saas', 'office 365', 'rocket money'
+    ],
+    'ATM & Cash Withdrawals': [
+        'atm', 'cash withdrawal', 'withdrawal', 'cash advance'
+    ],
+    'Banking & Finance': [
+        'transfer', 'fee', 'charge', 'finance', 'loan', 'interest',
+        'bank fee', 'service charge', 'wire transfer', 'zelle'
+    ],
+    'Personal Care': [
+        'salon', 'spa', 'barbershop', 'beauty', 'cosmetics', 'skincare',
+        'gym', 'fitness', '24hourfitness', 'planet fitness'
+    ]
+}
+
+# Categories are checked in this order; the first one with a keyword hit wins
+_CATEGORY_PRIORITY = (
+    'ATM & Cash Withdrawals',
+    'Subscriptions & Digital Services',
+    'Food & Dining',
+    'Transportation',
+    'Healthcare',
+    'Utilities & Bills',
+    'Entertainment',
+    'Shopping & Retail',
+    'Personal Care',
+    'Banking & Finance'
+)
+
+# One keyword trie per category, in priority order
+_CATEGORY_MATCHERS = tuple(
+    (category, re.compile(trie_pattern(_CATEGORIES[category])))
+    for category in _CATEGORY_PRIORITY
+)
+
+# All keywords in one trie: descriptions with no hit skip the per-category scans
+_ANY_KEYWORD_RE = re.compile(trie_pattern(
+    [keyword for keywords in _CATEGORIES.values() for keyword in keywords]
+))
+
 
 class BankStatementPDFProcessor:
     def __init__(self):
-        self.bank_patterns = {
-            'ADCB': ['abu dhabi commercial bank', 'adcb'],
-            'FAB': ['first abu dhabi bank', 'fab'],
-            'ENBD': ['emirates nbd', 'enbd'],
-            'MASHREQ': ['mashreq bank', 'mashreq'],
-            'CBD': ['commercial bank of dubai', 'cbd'],
-            'HSBC': ['hsbc'],
-            'RAKBANK': ['rak bank', 'rakbank'],
-            'ADIB': ['abu dhabi islamic bank', 'adib'],
-            'BOA': ['bank of america', 'bofa', 'boa', 'b of a'],
-            'CHASE': ['chase', 'jp morgan chase', 'jpmorgan'],
-            'WELLS': ['wells fargo', 'wells'],
-            'CITI': ['citibank', 'citi'],
-            'BARCLAYS': ['barclays'],
-            'LLOYDS': ['lloyds'],
-            'SBI': ['state bank of india', 'sbi'],
-            'HDFC': ['hdfc bank', 'hdfc'],
-            'ICICI': ['icici bank', 'icici']
-        }
+        self.bank_patterns = _BANK_PATTERNS
+        self.categories = _CATEGORIES
 
-        self.categories = {
-            'Food & Dining': [
-                'carrefour', 'lulu', 'spinneys', 'choithrams', 'union coop', 'waitrose',
-                'restaurant', 'cafe', 'kfc', 'mcdonald', 'pizza', 'subway', 'dominos',
-                'starbucks', 'costa', 'dunkin', 'burger', 'food', 'dining', 'eat',
-                'grocery', 'supermarket', 'hypermarket', 'bakery', 'deli', 'bistro',
-                'catering', 'takeaway', 'delivery', 'zomato', 'talabat', 'deliveroo',
-                'doordash', 'grubhub', 'uber eats', 'postmates', 'chipotle', 'panera',
-                'whole foods', 'trader joe', 'safeway', 'kroger', 'target', 'walmart',
-                'donuts', 'coffee', 'espresso', 'bacio di latte', 'butchery', 'zinque',
-                'ralphs', 'albertsons', 'vons', 'pavilions', 'publix', 'wegmans'
-            ],
-            'Transportation': [
-                'adnoc', 'eppco', 'enoc', 'petrol', 'fuel', 'gas', 'gasoline',
-                'taxi', 'uber', 'careem', 'metro', 'bus', 'rta', 'parking',
-                'salik', 'toll', 'car wash', 'transport', 'emirates', 'etihad',
-                'flydubai', 'air arabia', 'airline', 'flight', 'airport',
-                'chevron', 'shell', 'bp', '76', 'exxon', 'mobil', 'lyft'
-            ],
-            'Shopping & Retail': [
-                'mall', 'centrepoint', 'max', 'home centre', 'ikea', 'ace',
-                'sharaf dg', 'jumbo', 'electronics', 'clothing', 'fashion',
-                'shop', 'store', 'retail', 'amazon', 'noon', 'souq', 'namshi',
-                'h&m', 'zara', 'nike', 'adidas', 'apple', 'samsung', 'virgin',
-                'uniqlo', 'costco', 'best buy', 'macy', 'nordstrom'
-            ],
-            'Healthcare': [
-                'hospital', 'clinic', 'pharmacy', 'medical', 'doctor', 'health',
-                'dental', 'medicare', 'aster', 'nmc', 'mediclinic', 'life pharmacy',
-                'boots', 'cvs', 'walgreens'
-            ],
-            'Utilities & Bills': [
-                'dewa', 'addc', 'sewa', 'fewa', 'etisalat', 'du', 'internet',
-                'mobile', 'telecom', 'electricity', 'water', 'utility', 'bill',
-                'wifi', 'broadband', 'verizon', 'at&t', 't-mobile'
-            ],
-            'Entertainment': [
-                'cinema', 'movie', 'vox', 'reel', 'netflix', 'osn', 'gaming',
-                'entertainment', 'park', 'beach', 'attraction', 'ticket', 'event',
-                'spotify', 'youtube', 'disney', 'hulu', 'disneyland'
-            ],
-            'Subscriptions & Digital Services': [
-                'netflix', 'spotify', 'youtube premium', 'amazon prime', 'disney+',
-                'adobe', 'microsoft', 'google', 'icloud', 'dropbox', 'zoom',
-                'subscription', 'saas', 'office 365', 'rocket money'
-            ],
-            'ATM & Cash Withdrawals': [
-                'atm', 'cash withdrawal', 'withdrawal', 'cash advance'
-            ],
-            'Banking & Finance': [
-                'transfer', 'fee', 'charge', 'finance', 'loan', 'interest',
-                'bank fee', 'service charge', 'wire transfer', 'zelle'
-            ],
-            'Personal Care': [
-                'salon', 'spa', 'barbershop', 'beauty', 'cosmetics', 'skincare',
-                'gym', 'fitness', '24hourfitness', 'planet fitness'
-            ]
-        }
+        # Statements repeat the same merchants: memoize the keyword scan per description
+        self._categorize_cached = lru_cache(maxsize=4096)(self._categorize)
 
     def detect_bank(self, text):
         """Detect bank from PDF content"""
@@ -117,69 +285,52 @@ class BankStatementPDFProcessor:
         for bank_code, patterns in self.bank_patterns.items():
             for pattern in patterns:
                 if pattern in text_lower:
-                    return {
-                        'ADCB': 'Abu Dhabi Commercial Bank',
-                        'FAB': 'First Abu Dhabi Bank',
-                        'ENBD': 'Emirates NBD',
-                        'MASHREQ': 'Mashreq Bank',
-                        'CBD': 'Commercial Bank of Dubai',
-                        'HSBC': 'HSBC Bank Middle East',
-                        'RAKBANK': 'RAKBank',
-                        'ADIB': 'Abu Dhabi Islamic Bank',
-                        'BOA': 'Bank of America',
-                        'CHASE': 'Chase Bank',
-                        'WELLS': 'Wells Fargo',
-                        'CITI': 'Citibank',
-                        'BARCLAYS': 'Barclays',
-                        'LLOYDS': 'Lloyds Bank',
-                        'SBI': 'State Bank of India',
-                        'HDFC': 'HDFC Bank',
-                        'ICICI': 'ICICI Bank'
-                    }.get(bank_code, f'{bank_code} Bank')
+                    return _BANK_FULLNAMES.get(bank_code, f'{bank_code} Bank')
         return 'Unknown Bank'
 
     def categorize_transaction(self, description):
         """Categorize transaction based on description"""
-        desc_lower = description.lower().strip()
-
-        # Priority-based categorization
-        category_priority = [
-            'ATM & Cash Withdrawals',
-            'Subscriptions & Digital Services',
-            'Food & Dining',
-            'Transportation',
-            'Healthcare',
-            'Utilities & Bills',
-            'Entertainment',
-            'Shopping & Retail',
-            'Personal Care',
-            'Banking & Finance'
-        ]
-
-        for category in category_priority:
-            keywords = self.categories[category]
-            for keyword in keywords:
-                if keyword in desc_lower:
-                    return category
+        return self._categorize_cached(description)
+
+    def _categorize(self, description):
+        """Uncached keyword scan behind categorize_transaction"""
+        desc_lower = description.lower()
+        if not _ANY_KEYWORD_RE.search(desc_lower):
+            return 'Other Expenses'
+
+        for category, keyword_re in _CATEGORY_MATCHERS:
+            if keyword_re.search(desc_lower):
+                return category
 
         return 'Other Expenses'
 
     def extract_text_from_pdf(self, pdf_file):
-        """Extract text from PDF using multiple methods"""
-        text_content = ""
+        """Extract text from PDF using multiple methods; pdf_file is a path or a file object.
+        Returns (text, tables, page count), counting pages without any text"""
         tables_data = []
+        first_result = None  # returned when no method yields usable text
 
         try:
+            # Paths are opened directly by each library; file objects are read into memory once
+            if isinstance(pdf_file, (str, os.PathLike)):
+                pdf_source = pdf_file
+            else:
+                pdf_file.seek(0)
+                pdf_source = pdf_file.read()
+
             # Method 1: Try pdfplumber (best for tables)
             if PDF_PLUMBER_AVAILABLE:
                 try:
-                    pdf_file.seek(0)
-                    with pdfplumber.open(pdf_file) as pdf:
+                    page_texts = []
+                    parts = []
+                    with pdfplumber.open(_reopenable(pdf_source)) as pdf:
+                        page_count = len(pdf.pages)
                         for page_num, page in enumerate(pdf.pages, 1):
                             # Extract text
                             page_text = page.extract_text()
                             if page_text:
-                                text_content += f"\n--- PAGE {page_num} ---\n{page_text}\n"
+                                page_texts.append(page_text)
+                                parts.append(f"\n--- PAGE {page_num} ---\n{page_text}\n")
 
                             # Extract tables
                             tables = page.extract_tables()
@@ -189,49 +340,58 @@ class BankStatementPDFProcessor:
                                         'page': page_num,
                                         'data': table
                                     })
+                    text_content = "".join(parts)
 
-                    if text_content or tables_data:
-                        print(f"[PDF] Extracted {len(pdf.pages)} pages using pdfplumber")
-                        return text_content, tables_data
+                    if tables_data or _is_usable(page_texts):
+                        print(f"[PDF] Extracted {page_count} pages using pdfplumber")
+                        return text_content, tables_data, page_count
+                    if text_content.strip():
+                        first_result = (text_content, tables_data, page_count)
                 except Exception as e:
                     print(f"[PDF] pdfplumber failed: {e}")
 
             # Method 2: Try PyMuPDF (good for text extraction)
-            if PYMUPDF_AVAILABLE and not text_content:
+            if PYMUPDF_AVAILABLE:
                 try:
-                    pdf_file.seek(0)
-                    doc = fitz.open(stream=pdf_file.read(), filetype="pdf")
-                    for page_num in range(len(doc)):
-                        page = doc[page_num]
-                        text_content += f"\n--- PAGE {page_num + 1} ---\n{page.get_text()}\n"
+                    if isinstance(pdf_source, bytes):
+                        doc = fitz.open(stream=pdf_source, filetype="pdf")
+                    else:
+                        doc = fitz.open(pdf_source, filetype="pdf")
+                    page_texts = [page.get_text() for page in doc]
                     doc.close()
 
-                    if text_content:
-                        print(f"[PDF] Extracted {len(doc)} pages using PyMuPDF")
-                        return text_content, tables_data
+                    if _is_usable(page_texts):
+                        print(f"[PDF] Extracted {len(page_texts)} pages using PyMuPDF")
+                        return _join_pages(page_texts), tables_data, len(page_texts)
+                    if first_result is None and "".join(page_texts).strip():
+                        first_result = (_join_pages(page_texts), tables_data, len(page_texts))
                 except Exception as e:
                     print(f"[PDF] PyMuPDF failed: {e}")
 
             # Method 3: Fallback to PyPDF2
-            if PYPDF2_AVAILABLE and not text_content:
+            if PYPDF2_AVAILABLE:
                 try:
-                    pdf_file.seek(0)
-                    pdf_reader = PyPDF2.PdfReader(pdf_file)
-                    for page_num in range(len(pdf_reader.pages)):
-                        page = pdf_reader.pages[page_num]
-                        text_content += f"\n--- PAGE {page_num + 1} ---\n{page.extract_text()}\n"
-
-                    if text_content:
-                        print(f"[PDF] Extracted {len(pdf_reader.pages)} pages using PyPDF2")
-                        return text_content, tables_data
+                    pdf_reader = PyPDF2.PdfReader(_reopenable(pdf_source))
+                    page_texts = [page.extract_text() or "" for page in pdf_reader.pages]
+
+                    if _is_usable(page_texts):
+                        print(f"[PDF] Extracted {len(page_texts)} pages using PyPDF2")
+                        return _join_pages(page_texts), tables_data, len(page_texts)
+                    if first_result is None and "".join(page_texts).strip():
+                        first_result = (_join_pages(page_texts), tables_data, len(page_texts))
                 except Exception as e:
                     print(f"[PDF] PyPDF2 failed: {e}")
 
+            # Nothing looked like a statement: keep the first non-blank extraction
+            if first_result:
+                print("[PDF] No method extracted usable text; using the first non-blank result")
+                return first_result
+
         except Exception as e:
             print(f"[PDF] All text extraction methods failed: {e}")
-            return "", []
+            return "", [], 0
 
-        return text_content, tables_data
+        return "", [], 0
 
     def ai_extract_transactions(self, pdf_text, tables_data):
         """Use OpenAI to extract structured transaction data from PDF text"""
@@ -243,16 +403,16 @@ class BankStatementPDFProcessor:
             # Prepare comprehensive prompt with both text and table data
             table_info = ""
             if tables_data:
-                table_info = f"\n\nEXTRACTED TABLES ({len(tables_data)} tables):\n"
+                table_parts = [f"\n\nEXTRACTED TABLES ({len(tables_data)} tables):\n"]
                 for i, table in enumerate(tables_data[:5], 1):  # Limit to first 5 tables
-                    table_info += f"\nTable {i} (Page {table['page']}):\n"
-                    for row in table['data'][:20]:  # Limit rows
-                        table_info += f"{row}\n"
+                    table_parts.append(f"\nTable {i} (Page {table['page']}):\n")
+                    table_parts.extend(f"{row}\n" for row in table['data'][:20])  # Limit rows
+                table_info = "".join(table_parts)
 
             prompt = f"""You are an expert at extracting transaction data from bank statements. Extract ALL transactions from this PDF bank statement.
 
 PDF CONTENT:
-{pdf_text[:8000]}
+{_compact_statement_text(pdf_text)[:8000]}
 {table_info}
 
 INSTRUCTIONS:
@@ -323,7 +483,7 @@ Extract ALL transactions you can find. Return ONLY valid JSON."""
                 ai_response = ai_response.replace('```', '').strip()
 
             # Parse JSON
-            extracted_data = json.loads(ai_response)
+            extracted_data = orjson.loads(ai_response) if ORJSON_AVAILABLE else json.loads(ai_response)
             print(f"[AI] Successfully extracted {len(extracted_data.get('transactions', []))} transactions")
 
             return extracted_data
@@ -346,11 +506,22 @@ Extract ALL transactions you can find. Return ONLY valid JSON."""
 
         try:
             # Extract text and tables from PDF
-            pdf_text, tables_data = self.extract_text_from_pdf(pdf_file)
+            pdf_text, tables_data, page_count = self.extract_text_from_pdf(pdf_file)
 
             if not pdf_text and not tables_data:
                 return None, "Could not extract text from PDF. File may be encrypted or image-based."
 
+            if not tables_data:
+                page_text = _PAGE_MARKER_RE.sub('', pdf_text)
+
+                # Without a single digit there are no dates or amounts to find; skip the AI call
+                if not _DIGIT_RE.search(page_text):
+                    return None, "No transaction data found in PDF. It may be a scanned image; please upload a text-based statement."
+
+                # Scanned pages extract as little more than stray glyphs
+                if len(page_text.strip()) / max(page_count, 1) < PDF_MIN_CHARS_PER_PAGE:
+                    return None, "PDF appears to be image-based (scanned) and OCR is not enabled. Please upload a text-based PDF statement."
+
             # Use AI to extract structured transaction data
             extracted_data = self.ai_extract_transactions(pdf_text, tables_data)
 
@@ -363,23 +534,21 @@ Extract ALL transactions you can find. Return ONLY valid JSON."""
                 return None, "Could not extract transactions from PDF. Please check the file format."
 
             # Process and categorize transactions
+            # A try block costs nothing until it raises, so malformed rows from the AI
+            # are skipped per row rather than pre-validated
             transactions = []
             for tx in extracted_data['transactions']:
                 try:
-                    # Categorize
                     category = self.categorize_transaction(tx.get('description', ''))
-
-                    transaction = {
+                    transactions.append({
                         'Date': tx['date'],
                         'Amount': float(tx['amount']),
                         'Description': tx['description'],
                         'Category': category,
-                        'Subcategory': category.split(' ')[0] if category != 'Other Expenses' else 'Miscellaneous'
-                    }
-                    transactions.append(transaction)
+                        'Subcategory': _SUBCATEGORY[category]
+                    })
                 except Exception as e:
                     print(f"[PDF] Error processing transaction: {e}")
-                    continue
 
             # Get bank info
             bank_info = extracted_data.get('bank_info', {
@@ -404,7 +573,6 @@ Extract ALL transactions you can find. Return ONLY valid JSON."""
             }, None
 
         except Exception as e:
-            import traceback
             print(f"[ERROR] PDF processing failed: {str(e)}")
             traceback.print_exc()
             return None, f"Error processing PDF: {str(e)}"
@@ -414,50 +582,40 @@ Extract ALL transactions you can find. Return ONLY valid JSON."""
         print("[PDF] Using fallback extraction method...")
 
         transactions = []
-        lines = pdf_text.split('\n')
 
         # Try to detect bank
         bank_name = self.detect_bank(pdf_text[:2000])
 
-        # Simple pattern matching for common transaction formats
-        # Pattern: Date Amount Description
-        date_patterns = [
-            r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',  # DD/MM/YYYY or MM/DD/YYYY
-            r'(\d{4}[/-]\d{1,2}[/-]\d{1,2})'      # YYYY-MM-DD
-        ]
-
-        for line in lines:
-            line = line.strip()
-            if not line or len(line) < 10:
+        # Lines without a date are skipped inside the regex engine
+        for line_match in _DATED_LINE_RE.finditer(pdf_text):
+            line = line_match.group().strip()
+            if len(line) < 10:
                 continue
 
             # Skip headers and totals
-            if any(word in line.upper() for word in ['TOTAL', 'BALANCE', 'OPENING', 'CLOSING', 'DATE', 'DESCRIPTION']):
+            if _SKIP_LINE_RE.search(line):
                 continue
 
-            # Try to find date, amount, description
-            for pattern in date_patterns:
-                match = re.search(pattern, line)
-                if match:
-                    date_str = match.group(1)
-                    # Look for amount
-                    amount_match = re.search(r'[\-]?\d+[,.]?\d*\.?\d{2}', line)
-                    if amount_match:
-                        amount_str = amount_match.group(0).replace(',', '')
-                        try:
-                            amount = float(amount_str)
-                            # Get description (remaining text)
-                            description = re.sub(r'[\d/\-,.\s]+', ' ', line).strip()
-
-                            if description:
-                                transactions.append({
-                                    'date': self.normalize_date(date_str),
-                                    'description': description[:100],
-                                    'amount': amount
-                                })
-                        except:
-                            continue
-                    break
+            # Find amount and description
+            date_str = line_match.group('date')
+            amount_match = _AMOUNT_RE.search(line)
+            if amount_match:
+                amount_str = amount_match.group(0).replace(',', '')
+                try:
+                    amount = float(amount_str)
+                    # Get description (remaining text)
+                    description = _NONNUM_RE.sub(' ', line).strip()
+
+                    if description:
+                        transactions.append({
+                            'date': self.normalize_date(date_str),
+                            'description': description[:100],
+                            'amount': amount
+                        })
+                        if len(transactions) == 100:  # Limit fallback results
+                            break
+                except:
+                    continue
 
         return {
             'bank_info': {
@@ -466,20 +624,14 @@ Extract ALL transactions you can find. Return ONLY valid JSON."""
                 'account_number': 'Unknown',
                 'currency': 'USD'
             },
-            'transactions': transactions[:100]  # Limit fallback results
+            'transactions': transactions
         }
 
     def normalize_date(self, date_str):
         """Normalize date to YYYY-MM-DD format"""
-        patterns = [
-            ('%d/%m/%Y', r'\d{1,2}/\d{1,2}/\d{4}'),
-            ('%m/%d/%Y', r'\d{1,2}/\d{1,2}/\d{4}'),
-            ('%Y-%m-%d', r'\d{4}-\d{1,2}-\d{1,2}'),
-            ('%d-%m-%Y', r'\d{1,2}-\d{1,2}-\d{4}'),
-        ]
-
-        for fmt, pattern in patterns:
-            if re.match(pattern, date_str):
+        match = _DATE_SHAPE_RE.match(date_str)
+        if match:
+            for fmt in _DATE_SHAPE_FORMATS[match.lastgroup]:
                 try:
                     dt = datetime.strptime(date_str, fmt)
                     return dt.strftime('%Y-%m-%d')
@@ -493,60 +645,81 @@ Extract ALL transactions you can find. Return ONLY valid JSON."""
         if not openai.api_key or not transactions:
             return transactions
 
-        categories = [
-            'Food & Dining', 'Transportation', 'Shopping & Retail', 'Healthcare',
-            'Utilities & Bills', 'Entertainment', 'Subscriptions & Digital Services',
-            'ATM & Cash Withdrawals', 'Banking & Finance', 'Personal Care',
-            'Travel', 'Income', 'Other Expenses'
-        ]
-
         try:
-            batch_size = 50
-            categorized_transactions = []
+            # Only unique, not-yet-cached descriptions are sent to the model
+            keys = [normalize_description(tx['Description']) for tx in transactions]
+            category_by_key = get_cached_categories('pdf', keys)
+            pending = {}
+            for key, tx in zip(keys, transactions):
+                if key not in category_by_key:
+                    pending.setdefault(key, tx['Description'])
+            pending_keys = list(pending)
+            pending_descriptions = list(pending.values())
+
+            # Batches are independent requests, so they are sent concurrently;
+            # 30 descriptions per batch fit the 500-token response
+            batch_size = 30
+            starts = range(0, len(pending_descriptions), batch_size)
+
+            if pending_descriptions:
+                with ThreadPoolExecutor(max_workers=min(AI_CATEGORIZE_WORKERS, len(starts))) as executor:
+                    futures = [
+                        executor.submit(self._ai_categorize_batch, pending_descriptions[i:i + batch_size], i)
+                        for i in starts
+                    ]
+                    batch_categories = {}
+                    for i, future in zip(starts, futures):
+                        for offset, category in enumerate(future.result()):
+                            batch_categories[pending_keys[i + offset]] = category
+                store_cached_categories('pdf', batch_categories)
+                category_by_key.update(batch_categories)
+
+            for key, tx in zip(keys, transactions):
+                category = category_by_key.get(key)
+                if category:
+                    tx['Category'] = category
+                    tx['Subcategory'] = _subcategory(category)
 
-            for i in range(0, len(transactions), batch_size):
-                batch = transactions[i:i + batch_size]
-                descriptions = [f"{idx}. {tx['Description']}" for idx, tx in enumerate(batch, start=i)]
+            return transactions
+
+        except Exception as e:
+            print(f"[AI] Categorization failed: {e}")
+            return transactions
+
+    def _ai_categorize_batch(self, batch, i):
+        """Categorize one batch of descriptions with OpenAI; returns [] on error"""
+        descriptions = [f"{idx}. {description}" for idx, description in enumerate(batch, start=i)]
 
-                prompt = f"""Categorize these transactions into: {', '.join(categories)}
+        prompt = f"""Categorize these transactions into: {', '.join(_AI_CATEGORIES)}
 
 Transactions:
-{chr(10).join(descriptions[:30])}
+{chr(10).join(descriptions)}
 
 Return ONLY a JSON array of category names."""
 
-                try:
-                    response = openai.chat.completions.create(
-                        model="gpt-4o-mini",
-                        messages=[
-                            {"role": "system", "content": "Return only JSON array of categories."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        max_tokens=500,
-                        temperature=0.1
-                    )
-
-                    ai_response = response.choices[0].message.content.strip()
-                    if '```json' in ai_response:
-                        ai_response = ai_response.replace('```json', '').replace('```', '').strip()
-
-                    ai_categories = json.loads(ai_response)
-
-                    for idx, tx in enumerate(batch):
-                        if idx < len(ai_categories):
-                            tx['Category'] = ai_categories[idx]
-                            tx['Subcategory'] = ai_categories[idx].split(' ')[0]
-                        categorized_transactions.append(tx)
+        try:
+            response = openai.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": "Return only JSON array of categories."},
+                    {"role": "user", "content": prompt}
+                ],
+                max_tokens=500,
+                temperature=0.1
+            )
 
-                except Exception as e:
-                    print(f"[AI] Categorization error: {e}")
-                    categorized_transactions.extend(batch)
+            ai_response = response.choices[0].message.content.strip()
+            if '```json' in ai_response:
+                ai_response = ai_response.replace('```json', '').replace('```', '').strip()
+
+            ai_categories = orjson.loads(ai_response) if ORJSON_AVAILABLE else json.loads(ai_response)
 
-            return categorized_transactions
+            # Only well-formed category names are kept, in batch order
+            return [category if isinstance(category, str) else None for category in ai_categories[:len(batch)]]
 
         except Exception as e:
-            print(f"[AI] Categorization failed: {e}")
-            return transactions
+            print(f"[AI] Categorization error: {e}")
+            return []
 
 
 # Global processor instance
@@ -0,0 +1,127 @@
+"""
+Response builder for the /api/analyze endpoint
+Pure dict-building code with full type annotations, kept separate from the
+Flask handlers
+"""
+from datetime import datetime
+from operator import itemgetter
+from typing import Any, Dict, List
+
+
+def build_analysis_response(
+    financial_data: List[Dict[str, Any]],
+    totals: Dict[str, Any],
+    ai_analysis: Dict[str, Any],
+    bank_info: Dict[str, Any],
+    bank_name: str,
+    currency: str,
+    country: str,
+    savings_rate: float,
+    min_date: str,
+    max_date: str,
+) -> Dict[str, Any]:
+    """Assemble the analysis response from aggregated totals and the AI analysis"""
+    total_income: float = totals['total_income']
+    total_expenses: float = totals['total_expenses']
+    category_spending: Dict[str, float] = totals['category_spending']
+    sorted_monthly_data: Dict[str, float] = totals['monthly_data']
+    yearly_data: Dict[str, float] = totals['yearly_data']
+    expense_count: int = totals['expense_count']
+    net_savings = total_income - total_expenses
+
+    # Top categories
+    top_categories: List[Dict[str, Any]] = [
+        {
+            "name": cat,
+            "amount": amt,
+            "percentage": (amt/total_expenses*100) if total_expenses > 0 else 0
+        }
+        for cat, amt in sorted(category_spending.items(), key=itemgetter(1), reverse=True)[:8]
+    ]
+
+    # Risk level and trend derived from the savings rate
+    risk_level = "Low" if savings_rate > 20 else "Medium" if savings_rate > 10 else "High"
+    trend = "Stable" if savings_rate > 15 else "Needs Attention"
+
+    # AI fields referenced more than once in the response
+    health_score = ai_analysis.get("financial_health_score", 75)
+    savings_strategy = ai_analysis.get("savings_strategy", [])
+    risk_alerts = ai_analysis.get("risk_alerts", [])
+
+    # Enhanced AI Analysis Response
+    return {
+        "ai_analysis": {
+            # Traditional analysis
+            "spending_by_category": category_spending,
+            "income_vs_expenses": {
+                "total_income": total_income,
+                "total_expenses": total_expenses,
+                "net_savings": net_savings,
+                "savings_rate": savings_rate
+            },
+            "monthly_trends": sorted_monthly_data,
+            "yearly_trends": yearly_data,
+            "top_categories": top_categories,
+
+            # Enhanced AI Features
+            "financial_health": {
+                "score": health_score,
+                "category": ai_analysis.get("health_category", "Good"),
+                "assessment": f"Your financial health score is {health_score}/100"
+            },
+            "ai_insights": {
+                "key_insights": ai_analysis.get("key_insights", []),
+                "spending_patterns": ai_analysis.get("spending_patterns", []),
+                "country_insights": ai_analysis.get("country_insights", [])
+            },
+            "smart_recommendations": {
+                "budget_recommendations": ai_analysis.get("budget_recommendations", {}),
+                "savings_strategy": savings_strategy,
+                "action_plan": ai_analysis.get("action_plan", [])
+            },
+            "risk_management": {
+                "alerts": risk_alerts,
+                "anomalies": ai_analysis.get("anomalies", []),
+                "risk_level": risk_level
+            },
+            "predictions": {
+                "monthly_predictions": ai_analysis.get("monthly_predictions", {}),
+                "trends": trend,
+                "forecast_accuracy": "85%"
+            },
+
+            # Legacy fields for backward compatibility
+            "recommendations": savings_strategy[:3],
+            "spending_alerts": risk_alerts,
+            "financial_health_score": health_score,
+            "transaction_insights": {
+                "total_transactions": len(financial_data),
+                "average_transaction": totals['average_expense'],
+                "largest_expense": totals['largest_expense'],
+                "expense_transactions": expense_count,
+                "income_transactions": totals['income_count']
+            },
+            "summary": ai_analysis.get("summary", f"Advanced AI analysis for {bank_name} account in {currency}")
+        },
+        "basic_statistics": {
+            "Amount": {
+                "total": totals['amount_total'],
+                "average": total_expenses / len(financial_data) if financial_data else 0,
+                "max": totals['max_amount'],
+                "min": totals['min_amount']
+            },
+            "currency": currency,
+            "analysis_date": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        },
+        "bank_info": bank_info,
+        "data_overview": {
+            "total_records": len(financial_data),
+            "categories": list(category_spending.keys()),
+            "date_range": f"{min_date} to {max_date}",
+            "currency": currency,
+            "country": country,
+            "years_analyzed": len(yearly_data),
+            "year_list": list(yearly_data),
+            "months_analyzed": len(sorted_monthly_data)
+        }
+    }